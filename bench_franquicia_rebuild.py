@@ -0,0 +1,157 @@
+# bench_franquicia_rebuild.py — rebuild de plazas de franquicia: fila a fila vs por lotes
+# Genera CSV sintéticos (municipios + distritos de las ciudades grandes), ejecuta el rebuild
+# anterior (un SELECT por grupo y por slot) y services.rebuild_from_csv sobre dos SQLite
+# y comprueba que ambas tablas quedan idénticas: BD vacía, población +30% en todo, sin cambios
+# y +10% en el 2% de las filas (el caso de la actualización anual del INE).
+# Uso: python bench_franquicia_rebuild.py [--municipios 8100] [--seed 1] [--skip-legacy]
+import argparse
+import csv
+import importlib
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def write_csvs(directory: str, n_mun: int, seed: int, bump: float = 0.0, extra: float = 0.0, touch: float = 0.0) -> None:
+    rnd = random.Random(seed)
+    with open(os.path.join(directory, "municipios_es.csv"), "w", newline="", encoding="utf-8") as fm, \
+         open(os.path.join(directory, "distritos_es.csv"), "w", newline="", encoding="utf-8") as fd:
+        wm = csv.DictWriter(fm, fieldnames=["provincia", "municipio", "poblacion"])
+        wd = csv.DictWriter(fd, fieldnames=["provincia", "ciudad", "distrito", "poblacion"])
+        wm.writeheader()
+        wd.writeheader()
+        for i in range(n_mun):
+            prov = f"Provincia {i % 52}"
+            mun = f"Municipio {i}"
+            pop = rnd.paretovariate(1.1) * 800 * (1 + bump)
+            if (i * 2654435761) % 1000 < touch * 1000:
+                pop *= 1 + extra
+            pop = int(pop)
+            wm.writerow({"provincia": prov, "municipio": mun, "poblacion": pop if i % 97 else ""})
+            if pop > 150000:
+                for k in range(max(2, pop // 120000)):
+                    wd.writerow({"provincia": prov, "ciudad": mun, "distrito": f"Distrito {k}",
+                                 "poblacion": pop // (k + 2)})
+
+def load_modules(data_dir: str):
+    os.environ["PLAZAS_DATA_DIR"] = data_dir
+    sys.path.insert(0, os.path.dirname(ROOT))
+    pkg = os.path.basename(ROOT)
+    return importlib.import_module(f"{pkg}.models"), importlib.import_module(f"{pkg}.services")
+
+# ========= Implementación anterior (services.rebuild_from_csv) =========
+def legacy_rebuild(services, models, preserve_occupations: bool = True):
+    db, S, O = models.db, models.FranquiciaSlots, models.FranquiciaOcupacion
+    municipios = list(services._iter_csv(services.DATA_DIR / "municipios_es.csv"))
+    dist_csv = services.DATA_DIR / "distritos_es.csv"
+    distritos = list(services._iter_csv(dist_csv)) if dist_csv.exists() else []
+    idx_d = {}
+    for d in distritos:
+        idx_d.setdefault((d.get("provincia", ""), d.get("ciudad", "")), []).append(d)
+    if not preserve_occupations:
+        O.query.delete()
+        S.query.delete()
+        db.session.commit()
+    total_groups = created_slots = 0
+
+    def one(provincia, municipio, nivel, distrito, poblacion, slots):
+        nonlocal total_groups, created_slots
+        group = S.query.filter_by(provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito).first()
+        if not group:
+            db.session.add(S(provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito,
+                             poblacion=poblacion, slots=slots))
+            total_groups += 1
+        else:
+            group.poblacion = poblacion
+            group.slots = slots
+        db.session.flush()
+        for i in range(1, slots + 1):
+            occ = O.query.filter_by(provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito, slot_index=i).first()
+            if not occ:
+                db.session.add(O(provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito,
+                                 slot_index=i, ocupado=0, ocupado_por=None))
+                created_slots += 1
+
+    for m in municipios:
+        provincia = (m.get("provincia") or "").strip()
+        municipio = (m.get("municipio") or "").strip()
+        try:
+            poblacion = int(float(m.get("poblacion", -1))) if m.get("poblacion") not in (None, "") else -1
+        except Exception:
+            poblacion = -1
+        dlist = idx_d.get((provincia, municipio), [])
+        if dlist:
+            for d in dlist:
+                try:
+                    pob_d = int(float(d.get("poblacion", "0") or 0))
+                except Exception:
+                    pob_d = 0
+                one(provincia, municipio, "distrito", (d.get("distrito") or "").strip(), pob_d,
+                    max(1, math.ceil(pob_d / services.DISTRICT_RATIO)))
+        else:
+            one(provincia, municipio, "municipio", "", poblacion,
+                services._rule_slots_municipio(poblacion if poblacion >= 0 else 0))
+    db.session.commit()
+    return {"ok": True, "groups": total_groups, "created_slots": created_slots}
+
+# ========= Bench =========
+def snapshot(models):
+    db = models.db
+    slots = db.session.execute(db.text(
+        "SELECT id, provincia, municipio, nivel, distrito, poblacion, slots FROM franquicia_slots ORDER BY id")).all()
+    occ = db.session.execute(db.text(
+        "SELECT provincia, municipio, nivel, distrito, slot_index, ocupado, ocupado_por FROM franquicia_ocupacion "
+        "ORDER BY provincia, municipio, nivel, distrito, slot_index")).all()
+    return [tuple(r) for r in slots], [tuple(r) for r in occ]
+
+def main():
+    ap = argparse.ArgumentParser(description="Rebuild de plazas de franquicia: fila a fila vs por lotes")
+    ap.add_argument("--municipios", type=int, default=8100)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--skip-legacy", action="store_true", help="sólo el rebuild por lotes")
+    args = ap.parse_args()
+
+    from flask import Flask
+
+    tmp = tempfile.mkdtemp(prefix="franq_")
+    write_csvs(tmp, args.municipios, args.seed)
+    models, services = load_modules(tmp)
+
+    impls = [("lotes", services.rebuild_from_csv)]
+    if not args.skip_legacy:
+        impls.insert(0, ("legacy", lambda preserve_occupations=True: legacy_rebuild(services, models, preserve_occupations)))
+
+    passes = [("vacía", {}), ("+30%", {"bump": 0.3}), ("sin cambios", {"bump": 0.3}),
+              ("2% filas", {"bump": 0.3, "extra": 0.1, "touch": 0.02})]
+    results = {}
+    for name, fn in impls:
+        app = Flask(name)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, f"{name}.db")
+        models.db.init_app(app)
+        with app.app_context():
+            models.db.create_all()
+            out = []
+            for i, (label, csv_args) in enumerate(passes):
+                write_csvs(tmp, args.municipios, args.seed, **csv_args)
+                if i == 1:
+                    # Ocupar algunos slots: el rebuild no debe tocarlos
+                    models.db.session.execute(models.db.text(
+                        "UPDATE franquicia_ocupacion SET ocupado = 1, ocupado_por = 'bench' WHERE id % 7 = 0"))
+                    models.db.session.commit()
+                t = time.perf_counter()
+                r = fn()
+                dt = time.perf_counter() - t
+                out.append((r["groups"], r["created_slots"]))
+                print(f"{name:<7} {label:<12} {dt:7.2f} s  grupos nuevos={r['groups']:<6} slots creados={r['created_slots']}")
+            results[name] = (out, snapshot(models))
+            models.db.session.remove()
+
+    if len(results) == 2:
+        print("resultado idéntico:", results["legacy"] == results["lotes"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bench_voice_alloc.py — memoria asignada por trama en el camino caliente del gateway (main.py)
+# Compara el camino original (float32 + tobytes + base64 + json.dumps por trama) con el actual
+# (FrameBuffers + Resampler + FrameCoalescer + LegQueue con bloques reciclados + JSON por plantilla).
+# Mide con tracemalloc (numpy también registra ahí sus buffers):
+#   pico_B   bytes temporales en el pico de cada trama (media)
+#   total_B  bytes que quedan asignados tras todas las tramas (crecimiento de RSS)
+#   bloques  bloques vivos por trama: diferencia de `count` en snapshot.statistics('lineno')
+#            entre antes y después de N tramas, dividida por N (lo que cada trama deja asignado)
+# Uso: python bench_voice_alloc.py [--frames 5000]
+import argparse
+import base64
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from bench_voice_codec import legacy_mulaw_decode, legacy_mulaw_encode, legacy_resample_linear
+from voice_buffers import FrameBuffers, b64_bytes, b64_text
+from voice_codec import ulaw_encode
+from voice_coalesce import FrameCoalescer
+from voice_queues import LegQueue
+from voice_resample import Resampler
+
+FRAME_MS = 20
+
+def _drive(coro) -> None:
+    """Ejecuta una corrutina que no llega a suspenderse (push/put_audio con policy != block)."""
+    try:
+        coro.send(None)
+    except StopIteration:
+        return
+    raise RuntimeError("la corrutina se suspendió")
+
+def _consume(q: LegQueue) -> None:
+    """Lo que hace LegQueue.run por mensaje, sin socket: serializar y devolver el bloque a la cola."""
+    while q.depth:
+        item = q._items.popleft()
+        q._audio_bytes -= len(item.buf)
+        q._encode_audio(item.buf)
+        q._recycle(item.buf)
+
+# ========= Caminos por trama =========
+def before_in(payload: str) -> None:
+    """Twilio -> modelo, código original: sin agrupar, todo se reasigna en cada trama."""
+    ulaw = base64.b64decode(payload)
+    pcm_8k = legacy_mulaw_decode(ulaw)
+    pcm_16k = legacy_resample_linear(pcm_8k, 8000, 16000)
+    json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(pcm_16k.tobytes()).decode()})
+
+def before_out(delta: str) -> None:
+    """Modelo -> Twilio, código original."""
+    pcm = np.frombuffer(base64.b64decode(delta), dtype=np.int16)
+    ulaw = legacy_mulaw_encode(legacy_resample_linear(pcm, 16000, 8000))
+    json.dumps({"event": "media", "streamSid": "MZbench", "media": {"payload": base64.b64encode(ulaw).decode()}})
+
+def make_after(window_ms: int):
+    up, down = Resampler(8000, 16000), Resampler(16000, 8000)
+    in_frames, out_frames = FrameBuffers(), FrameBuffers()
+
+    def encode_append(chunk) -> str:
+        return f'{{"type":"input_audio_buffer.append","audio":"{b64_text(chunk)}"}}'
+
+    def encode_media(chunk) -> str:
+        return f'{{"event":"media","streamSid":"MZbench","media":{{"payload":"{b64_text(chunk)}"}}}}'
+
+    async def never(_text):  # el consumidor se simula con _consume
+        pass
+
+    to_ai = LegQueue("ai", never, encode_append, 50, 64000)
+    to_twilio = LegQueue("twilio", never, encode_media, 50, 16000)
+    coalescer = FrameCoalescer(window_ms, 32, to_ai.put_audio)
+
+    def after_in(payload: str) -> None:
+        pcm_16k = up.process(in_frames.decode(b64_bytes(payload)))
+        _drive(coalescer.push(pcm_16k))
+        _consume(to_ai)
+
+    def after_out(delta: str) -> None:
+        pcm = np.frombuffer(b64_bytes(delta), dtype=np.int16)
+        _drive(to_twilio.put_audio(out_frames.encode(down.process(pcm))))
+        _consume(to_twilio)
+
+    return after_in, after_out
+
+# ========= Medición =========
+_SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),)
+
+def _blocks() -> int:
+    """Bloques vivos trazados, sin contar los del propio tracemalloc."""
+    snap = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    return sum(stat.count for stat in snap.statistics("lineno"))
+
+def measure(fn, arg, frames: int) -> dict:
+    for _ in range(50):  # calentamiento: cachés internas, buffers ya dimensionados
+        fn(arg)
+    tracemalloc.start()
+    blocks0 = _blocks()
+    base, _ = tracemalloc.get_traced_memory()
+    peaks = 0
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks += peak - before
+    elapsed = time.perf_counter() - t0
+    current, _ = tracemalloc.get_traced_memory()
+    blocks = _blocks() - blocks0
+    tracemalloc.stop()
+    return {"pico_B": peaks / frames, "total_B": current - base, "bloques": blocks / frames,
+            "us": elapsed / frames * 1e6}
+
+def main():
+    ap = argparse.ArgumentParser(description="Memoria asignada por trama: camino original vs buffers preasignados")
+    ap.add_argument("--frames", type=int, default=5000)
+    ap.add_argument("--window-ms", type=int, default=60, help="ventana del agrupador (VOICE_APPEND_WINDOW_MS)")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(1234)
+    pcm_8k = (rng.standard_normal(8 * FRAME_MS) * 6000).clip(-32768, 32767).astype(np.int16)
+    payload = base64.b64encode(ulaw_encode(pcm_8k)).decode()        # trama de Twilio (20 ms µ-law)
+    delta = base64.b64encode(np.repeat(pcm_8k, 2).tobytes()).decode()  # delta del modelo (20 ms PCM16 16k)
+    after_in, after_out = make_after(args.window_ms)
+
+    rows = [
+        ("twilio->modelo", before_in, after_in, payload),
+        ("modelo->twilio", before_out, after_out, delta),
+    ]
+    print(f"{args.frames} tramas de {FRAME_MS} ms (con tracemalloc activo: los µs son relativos)")
+    print(f"{'sentido':<16}{'camino':<10}{'pico B/trama':>14}{'retenido B':>12}{'bloques/trama':>15}{'µs/trama':>10}")
+    for name, old, new, arg in rows:
+        for label, fn in (("original", old), ("buffers", new)):
+            r = measure(fn, arg, args.frames)
+            print(f"{name:<16}{label:<10}{r['pico_B']:>14.0f}{r['total_B']:>12}{r['bloques']:>15.3f}{r['us']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
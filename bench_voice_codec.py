@@ -0,0 +1,79 @@
+# bench_voice_codec.py — micro-benchmark por trama: codec µ-law (voice_codec) y re-muestreo (voice_resample)
+# frente a las implementaciones anteriores de main.py
+# Uso: python bench_voice_codec.py [--frames 20000] [--frame-ms 20]
+import argparse
+import timeit
+
+import numpy as np
+
+from voice_codec import ulaw_decode, ulaw_encode
+from voice_resample import Resampler
+
+# ========= Implementación anterior (main.py, float32 + log1p) =========
+MU = 255.0
+
+def legacy_mulaw_decode(ulaw_bytes: bytes) -> np.ndarray:
+    u = np.frombuffer(ulaw_bytes, dtype=np.uint8).astype(np.float32)
+    u = 255.0 - u
+    sign = np.where(u >= 128, -1.0, 1.0)
+    exponent = (u % 128) / 16.0
+    mantissa = (u % 16) / 16.0
+    x = sign * ((1.0 / MU) * ((1.0 + MU) ** (exponent + mantissa) - 1.0))
+    return np.clip(x * 32767.0, -32768, 32767).astype(np.int16)
+
+def legacy_mulaw_encode(pcm16: np.ndarray) -> bytes:
+    x = np.clip(pcm16.astype(np.float32) / 32768.0, -1.0, 1.0)
+    sign = np.sign(x)
+    y = np.log1p(MU * np.abs(x)) / np.log1p(MU)
+    u = (1 - (sign < 0).astype(np.uint8)) * 0x7F
+    mag = (y * 127.0).astype(np.uint8)
+    out = (u & 0x80) | (127 - mag)
+    return out.tobytes()
+
+def legacy_resample_linear(x: np.ndarray, src_hz: int, dst_hz: int) -> np.ndarray:
+    if src_hz == dst_hz or x.size == 0:
+        return x
+    ratio = dst_hz / src_hz
+    idx = np.arange(0, int(len(x) * ratio), 1.0) / ratio
+    idx0 = np.floor(idx).astype(int)
+    idx1 = np.minimum(idx0 + 1, len(x) - 1)
+    frac = idx - idx0
+    y = (1.0 - frac) * x[idx0] + frac * x[idx1]
+    return y.astype(x.dtype)
+
+# ========= Benchmark =========
+def _bench(old, new, arg, frames: int, repeat: int = 7):
+    """µs por trama (mejor repetición) de cada implementación; se alternan para que el ruido les afecte igual."""
+    best_old = best_new = float("inf")
+    for _ in range(repeat):
+        best_old = min(best_old, timeit.timeit(lambda: old(arg), number=frames))
+        best_new = min(best_new, timeit.timeit(lambda: new(arg), number=frames))
+    return best_old / frames * 1e6, best_new / frames * 1e6
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark codec µ-law y re-muestreo por trama")
+    ap.add_argument("--frames", type=int, default=20000)
+    ap.add_argument("--frame-ms", type=int, default=20, help="duración de trama a 8 kHz")
+    args = ap.parse_args()
+
+    n = 8 * args.frame_ms  # muestras por trama a 8 kHz
+    rng = np.random.default_rng(1234)
+    pcm = (rng.standard_normal(n) * 6000).clip(-32768, 32767).astype(np.int16)
+    ulaw = ulaw_encode(pcm)
+    pcm_16k = np.repeat(pcm, 2)
+    up, down = Resampler(8000, 16000), Resampler(16000, 8000)
+
+    rows = [
+        ("decode", legacy_mulaw_decode, ulaw_decode, ulaw),
+        ("encode", legacy_mulaw_encode, ulaw_encode, pcm),
+        ("8k->16k", lambda x: legacy_resample_linear(x, 8000, 16000), up.process, pcm),
+        ("16k->8k", lambda x: legacy_resample_linear(x, 16000, 8000), down.process, pcm_16k),
+    ]
+    print(f"trama: {n} muestras ({args.frame_ms} ms @ 8 kHz), {args.frames} iteraciones")
+    print(f"{'op':<8}{'anterior µs':>14}{'nuevo µs':>12}{'speedup':>10}")
+    for name, old, new, arg in rows:
+        t_old, t_new = _bench(old, new, arg, args.frames)
+        print(f"{name:<8}{t_old:>14.2f}{t_new:>12.2f}{t_old / t_new:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_voice_intents.py — precisión y coste de la detección de idioma/intención del bot de voz
+# Compara las funciones anteriores de voice_bot.py (búsquedas `in` por listas) con voice_intents
+# sobre dos corpus etiquetados:
+#   data/voice_intents_corpus.tsv   -> con el que se escribieron las tablas (precisión optimista)
+#   data/voice_intents_heldout.tsv  -> de control: frases que no se han usado para ajustarlas
+# La precisión que cuenta es la de control; si se añaden palabras a las tablas por un fallo de
+# control, esa frase pasa al corpus de desarrollo y se escriben otras nuevas para el de control.
+# Uso: python bench_voice_intents.py [--corpus ...] [--heldout ...] [--misses]
+import argparse
+import os
+import timeit
+
+from voice_intents import analyze
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_CORPUS = os.path.join(DATA_DIR, "voice_intents_corpus.tsv")
+DEFAULT_HELDOUT = os.path.join(DATA_DIR, "voice_intents_heldout.tsv")
+
+# ========= Implementación anterior (voice_bot.py) =========
+def legacy_detect_language(text: str) -> str:
+    t = (text or "").lower()
+    if any(k in t for k in ["hello", "reservation", "booking", "deposit", "owner", "franchise", "opportunity"]):
+        return "en"
+    if any(k in t for k in ["hola", "reserva", "reservar", "señal", "propietario", "franquicia", "oportunidad"]):
+        return "es"
+    return "es"
+
+def legacy_detect_intent(text: str, lang: str) -> str:
+    t = (text or "").lower()
+    if lang == "en":
+        if "reservation" in t or "booking" in t: return "reservas"
+        if "landlord" in t or "owner" in t: return "propietarios"
+        if "franchise" in t: return "franquiciados"
+        if "opportunit" in t or "partner" in t: return "oportunidades"
+        if "person" in t or "agent" in t: return "human"
+    else:
+        if "reserva" in t or "señal" in t: return "reservas"
+        if "propietario" in t or "dueño" in t: return "propietarios"
+        if "franquici" in t: return "franquiciados"
+        if "oportunidad" in t or "colaborador" in t: return "oportunidades"
+        if "persona" in t or "agente" in t: return "human"
+    return "unknown"
+
+def legacy(text: str):
+    lang = legacy_detect_language(text)
+    return lang, legacy_detect_intent(text, lang)
+
+def current(text: str):
+    result = analyze(text)
+    return result.lang, result.intent
+
+# ========= Corpus =========
+def load_corpus(path: str):
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            lang, intent, text = line.rstrip("\n").split("\t", 2)
+            rows.append((lang, intent, text))
+    return rows
+
+def accuracy(fn, rows):
+    lang_ok = intent_ok = both_ok = 0
+    misses = []
+    for lang, intent, text in rows:
+        got_lang, got_intent = fn(text)
+        lang_ok += got_lang == lang
+        intent_ok += got_intent == intent
+        if got_lang == lang and got_intent == intent:
+            both_ok += 1
+        else:
+            misses.append((lang, intent, got_lang, got_intent, text))
+    n = len(rows)
+    return {"lang_acc": lang_ok / n, "intent_acc": intent_ok / n, "both_acc": both_ok / n, "misses": misses}
+
+def cost_us(fns: dict, texts, number: int = 200, repeat: int = 7) -> dict:
+    """µs por frase; las implementaciones se alternan en cada repetición para que el ruido les afecte igual."""
+    best = {name: float("inf") for name in fns}
+    for _ in range(repeat):
+        for name, fn in fns.items():
+            t = timeit.timeit(lambda: [fn(x) for x in texts], number=number)
+            best[name] = min(best[name], t / (number * len(texts)) * 1e6)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description="Precisión y coste de detección idioma/intención")
+    ap.add_argument("--corpus", default=DEFAULT_CORPUS)
+    ap.add_argument("--heldout", default=DEFAULT_HELDOUT)
+    ap.add_argument("--misses", action="store_true", help="lista los fallos de la implementación actual")
+    args = ap.parse_args()
+
+    impls = {"anterior": legacy, "actual": current}
+    sets = {"desarrollo": load_corpus(args.corpus), "control": load_corpus(args.heldout)}
+    cost = cost_us(impls, [r[2] for rows in sets.values() for r in rows])
+    results = {}
+    for set_name, rows in sets.items():
+        print(f"{set_name}: {len(rows)} frases ({args.corpus if set_name == 'desarrollo' else args.heldout})")
+    print(f"{'impl':<10}{'conjunto':<12}{'idioma':>8}{'intención':>11}{'ambos':>8}{'µs/frase':>10}")
+    for name, fn in impls.items():
+        for set_name, rows in sets.items():
+            r = results[name, set_name] = accuracy(fn, rows)
+            print(f"{name:<10}{set_name:<12}{r['lang_acc']:>8.1%}{r['intent_acc']:>11.1%}{r['both_acc']:>8.1%}"
+                  f"{cost[name]:>10.2f}")
+    old, new = results["anterior", "control"], results["actual", "control"]
+    ratio = cost["actual"] / cost["anterior"]
+    if ratio > 1:
+        print(f"compromiso: {ratio:.1f}x más lento por frase (+{cost['actual'] - cost['anterior']:.1f} µs) "
+              f"a cambio de {old['both_acc']:.1%} -> {new['both_acc']:.1%} de acierto en control")
+    else:
+        print(f"{1 / ratio:.1f}x más rápido y {old['both_acc']:.1%} -> {new['both_acc']:.1%} de acierto en control")
+    if args.misses:
+        for set_name in sets:
+            for lang, intent, got_lang, got_intent, text in results["actual", set_name]["misses"]:
+                print(f"  [{set_name}] {lang}/{intent} -> {got_lang}/{got_intent}: {text}")
+
+if __name__ == "__main__":
+    main()
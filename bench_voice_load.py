@@ -0,0 +1,222 @@
+# bench_voice_load.py — carga de N llamadas simultáneas contra el gateway de voz (main.py)
+# - Levanta un Realtime falso local (eco de audio con latencia y ráfagas configurables).
+# - Arranca el gateway con uvicorn (1 worker) apuntando a ese Realtime, salvo --gateway-url.
+# - Simula N streams de Twilio a ritmo real (tramas µ-law de 20 ms) y mide la latencia por trama
+#   (envío de la trama -> vuelta del audio equivalente), CPU y RSS del proceso gateway.
+#
+# Uso:
+#   python bench_voice_load.py --calls 50 --duration 20
+#   python bench_voice_load.py --calls 10,50,100 --ai-latency-ms 300 --burst 5 --transcode
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+FRAME_MS = 20
+FRAME_BYTES = 160  # µ-law 8 kHz, 20 ms
+
+# ========= Realtime falso =========
+class FakeRealtime:
+    """
+    Eco del audio recibido como response.audio.delta (misma duración, mismo formato negociado).
+    - latency_ms: espera antes de devolver cada bloque.
+    - burst: agrupa N appends y los devuelve seguidos (el modelo genera más rápido que tiempo real).
+    """
+
+    def __init__(self, latency_ms: float, burst: int):
+        self.latency_s = latency_ms / 1000.0
+        self.burst = max(1, burst)
+        self.sessions = 0
+        self.appends = 0
+
+    async def handler(self, ws, path=None):
+        self.sessions += 1
+        pending = []
+        item = 0
+        async for raw in ws:
+            evt = json.loads(raw)
+            if evt.get("type") != "input_audio_buffer.append":
+                continue
+            self.appends += 1
+            pending.append(evt["audio"])
+            if len(pending) < self.burst:
+                continue
+            chunks, pending = pending, []
+            item += 1
+            asyncio.ensure_future(self._echo(ws, chunks, f"item_{item}"))
+
+    async def _echo(self, ws, chunks, item_id):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        try:
+            for audio in chunks:
+                await ws.send(json.dumps({"type": "response.audio.delta", "item_id": item_id, "delta": audio}))
+        except Exception:
+            pass
+
+# ========= Llamada Twilio simulada =========
+async def simulated_call(url: str, call_no: int, duration_s: float, latencies: list, totals: dict):
+    sent_ts = []          # instante de envío de cada trama
+    received = 0          # bytes µ-law devueltos por el gateway
+    matched = 0           # tramas cuya vuelta ya se ha medido
+    frames = int(duration_s * 1000 / FRAME_MS)
+    payload = base64.b64encode(bytes((i * 7 + call_no) & 0xFF for i in range(FRAME_BYTES))).decode()
+    sid = f"MZbench{call_no:05d}"
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def reader():
+            nonlocal received, matched
+            async for raw in ws:
+                msg = json.loads(raw)
+                ev = msg.get("event")
+                if ev == "media":
+                    received += len(base64.b64decode(msg["media"]["payload"]))
+                    now = time.perf_counter()
+                    # La trama k ha vuelto cuando el audio devuelto alcanza su duración acumulada
+                    while matched < len(sent_ts) and received >= (matched + 1) * FRAME_BYTES:
+                        latencies.append(now - sent_ts[matched])
+                        matched += 1
+                elif ev == "mark":
+                    # Twilio devuelve las marcas al reproducir: aquí, inmediatamente
+                    await ws.send(json.dumps({"event": "mark", "streamSid": sid, "mark": msg["mark"]}))
+
+        rtask = asyncio.ensure_future(reader())
+        await ws.send(json.dumps({"event": "start", "start": {"streamSid": sid, "callSid": f"CAbench{call_no:05d}"}}))
+        t0 = time.perf_counter()
+        for k in range(frames):
+            # Ritmo real con reloj absoluto (sin deriva acumulada)
+            delay = t0 + k * FRAME_MS / 1000.0 - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent_ts.append(time.perf_counter())
+            await ws.send(json.dumps({"event": "media", "streamSid": sid, "media": {"payload": payload}}))
+        await asyncio.sleep(1.0)  # margen para que vuelva el audio pendiente
+        await ws.send(json.dumps({"event": "stop", "streamSid": sid}))
+        rtask.cancel()
+    totals["frames_sent"] += frames
+    totals["bytes_back"] += received
+
+# ========= Proceso gateway =========
+def _proc_cpu_s(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+def _proc_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+def start_gateway(port: int, fake_url: str, transcode: bool) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "bench",
+        "OPENAI_REALTIME_URL": fake_url,
+        "VOICE_ULAW_PASSTHROUGH": "off" if transcode else "on",
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL,  # el resumen por llamada del gateway no interesa aquí
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/voice/health", timeout=1)
+            return proc
+        except Exception:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("el gateway no arrancó")
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+# ========= Ejecución =========
+async def run_level(calls: int, args, ws_url: str, pid):
+    latencies, totals = [], {"frames_sent": 0, "bytes_back": 0}
+    cpu0 = _proc_cpu_s(pid) if pid else None
+    wall0 = time.perf_counter()
+    # Arranque escalonado en 1 s para no sincronizar todas las tramas
+    tasks = []
+    for i in range(calls):
+        tasks.append(asyncio.ensure_future(simulated_call(ws_url, i, args.duration, latencies, totals)))
+        await asyncio.sleep(1.0 / calls)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    wall = time.perf_counter() - wall0
+    failed = sum(1 for r in results if isinstance(r, Exception))
+
+    row = {
+        "calls": calls, "failed": failed,
+        "frames_sent": totals["frames_sent"],
+        "echo_ratio": round(totals["bytes_back"] / max(1, totals["frames_sent"] * FRAME_BYTES), 3),
+        "p50_ms": round(_pct(latencies, 50) * 1000, 1),
+        "p99_ms": round(_pct(latencies, 99) * 1000, 1),
+    }
+    if pid:
+        cpu = _proc_cpu_s(pid) - cpu0
+        util = cpu / wall  # núcleos ocupados de media
+        row.update({
+            "cpu_util": round(util, 3),
+            "calls_per_core": round(calls / util, 1) if util > 0 else None,
+            "rss_mb": round(_proc_rss_mb(pid), 1),
+        })
+    return row
+
+async def main_async(args):
+    fake = FakeRealtime(args.ai_latency_ms, args.burst)
+    async with websockets.serve(fake.handler, "127.0.0.1", args.fake_port, max_size=None):
+        proc = None
+        if args.gateway_url:
+            ws_url, pid = args.gateway_url, args.gateway_pid
+        else:
+            proc = await asyncio.get_running_loop().run_in_executor(
+                None, start_gateway, args.port, f"ws://127.0.0.1:{args.fake_port}", args.transcode)
+            ws_url, pid = f"ws://127.0.0.1:{args.port}/stream/twilio", proc.pid
+        try:
+            rows = []
+            for calls in [int(x) for x in str(args.calls).split(",") if x.strip()]:
+                row = await run_level(calls, args, ws_url, pid)
+                rows.append(row)
+                print(json.dumps(row) if args.json else
+                      "  ".join(f"{k}={v}" for k, v in row.items()), flush=True)
+            return rows
+        finally:
+            if proc:
+                # Esperar sin bloquear el loop: el Realtime falso debe poder cerrar las sesiones del pool
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(None, proc.wait), 10)
+                except asyncio.TimeoutError:
+                    proc.kill()
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga concurrente del gateway de voz con Realtime falso")
+    ap.add_argument("--calls", default="10", help="llamadas simultáneas; lista separada por comas para escalonar")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos de audio por llamada")
+    ap.add_argument("--ai-latency-ms", type=float, default=0.0, help="latencia del Realtime falso")
+    ap.add_argument("--burst", type=int, default=1, help="appends agrupados por ráfaga de respuesta")
+    ap.add_argument("--transcode", action="store_true", help="VOICE_ULAW_PASSTHROUGH=off en el gateway")
+    ap.add_argument("--port", type=int, default=8899, help="puerto del gateway lanzado por el bench")
+    ap.add_argument("--fake-port", type=int, default=8898, help="puerto del Realtime falso")
+    ap.add_argument("--gateway-url", default="", help="gateway ya arrancado (ws://.../stream/twilio) con OPENAI_REALTIME_URL=ws://127.0.0.1:<fake-port>")
+    ap.add_argument("--gateway-pid", type=int, default=0, help="PID del gateway externo para medir CPU/RSS")
+    ap.add_argument("--json", action="store_true", help="una línea JSON por nivel")
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
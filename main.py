@@ -1,79 +1,223 @@
 import os
 import json
-import base64
 import asyncio
+import contextlib
+import time
 from typing import Optional
+from urllib.parse import parse_qs
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import Response, PlainTextResponse
 import websockets
 import numpy as np
 
+from voice_buffers import FrameBuffers, b64_bytes, b64_text
+from voice_resample import Resampler
+from voice_coalesce import FrameCoalescer
+from voice_queues import LegQueue
+from voice_playback import PlaybackTracker
+from voice_pool import RealtimePool
+from voice_metrics import GATEWAY, CallMetrics
+from voice_admission import CallAdmission, overflow_twiml
+from voice_vad import EnergyVAD
+from voice_capture import CaptureWriter, KIND_MODEL_DELTA, KIND_TWILIO_MEDIA
+from voice_recorder import CallRecorder, CallRecording
+
 # ========= CONFIG =========
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_REALTIME_MODEL = os.getenv("OPENAI_REALTIME_MODEL", "gpt-4o-realtime-preview")
-OPENAI_REALTIME_URL = f"wss://api.openai.com/v1/realtime?model={OPENAI_REALTIME_MODEL}"
+# OPENAI_REALTIME_URL permite apuntar a otro endpoint (p. ej. el Realtime falso de bench_voice_load.py)
+OPENAI_REALTIME_URL = os.getenv("OPENAI_REALTIME_URL") or f"wss://api.openai.com/v1/realtime?model={OPENAI_REALTIME_MODEL}"
+
+# µ-law nativo extremo a extremo: el Realtime recibe y devuelve g711_ulaw y el gateway
+# reenvía los payloads base64 tal cual. Con "off" se transcodifica (PCM16 16k) como antes.
+ULAW_PASSTHROUGH = os.getenv("VOICE_ULAW_PASSTHROUGH", "on").lower() == "on"
+
+# Ventana de agrupación de audio hacia el modelo (ms). Twilio manda tramas de 20 ms:
+# 60 ms = 1 input_audio_buffer.append por cada 3 tramas. Más ventana = menos mensajes, más latencia.
+APPEND_WINDOW_MS = max(20, int(os.getenv("VOICE_APPEND_WINDOW_MS", "60")))
+
+# Colas acotadas por sentido (Twilio -> modelo y modelo -> Twilio), ver voice_queues.
+# Política al llenarse: merge | drop_oldest | drop_newest | block
+QUEUE_POLICY = os.getenv("VOICE_QUEUE_POLICY", "merge").lower()
+QUEUE_MAX_ITEMS = int(os.getenv("VOICE_QUEUE_MAX_ITEMS", "50"))
+QUEUE_MAX_MS = int(os.getenv("VOICE_QUEUE_MAX_MS", "2000"))  # audio máximo encolado por sentido
+
+# Pool de sesiones Realtime pre-calentadas por worker (0 = desactivado)
+POOL_SIZE = int(os.getenv("VOICE_POOL_SIZE", "2"))
+POOL_IDLE_S = float(os.getenv("VOICE_POOL_IDLE_S", "300"))  # una sesión sin usar más tiempo se recicla
+
+# Control de admisión por worker (0 = sin límite). Por encima del límite /voice/answer
+# no abre stream: pasa la llamada a un agente (dial) o la retiene y reintenta (hold).
+MAX_CONCURRENT_CALLS = int(os.getenv("VOICE_MAX_CONCURRENT_CALLS", "0"))
+OVERFLOW_ACTION = os.getenv("VOICE_OVERFLOW_ACTION", "dial").lower()
+OVERFLOW_HOLD_S = int(os.getenv("VOICE_OVERFLOW_HOLD_S", "15"))
+
+# VAD local por energía sobre el audio del llamante (voice_vad): off | drop | thin.
+# El hangover debe cubrir el silencio que el server_vad del modelo necesita para cerrar turno (~500 ms).
+VAD_MODE = os.getenv("VOICE_VAD", "off").lower()
+VAD_THRESHOLD_DBFS = float(os.getenv("VOICE_VAD_THRESHOLD_DBFS", "-45"))
+VAD_HANGOVER_MS = int(os.getenv("VOICE_VAD_HANGOVER_MS", "600"))
+VAD_PREROLL_MS = int(os.getenv("VOICE_VAD_PREROLL_MS", "60"))
+VAD_THIN_EVERY = int(os.getenv("VOICE_VAD_THIN_EVERY", "5"))  # modo thin: 1 de cada N tramas de silencio
+
+# Captura binaria del audio crudo de cada sesión (voice_capture / voice_replay.py). Vacío = desactivada.
+CAPTURE_DIR = os.getenv("VOICE_CAPTURE_DIR", "")
+
+# Grabación de las dos patas para QA (voice_recorder): vacío = desactivada. wav (PCM16) | ulaw.
+# RECORD_MAX_MB acota el audio pendiente de escribir por worker; por encima se descartan tramas.
+RECORD_DIR = os.getenv("VOICE_RECORD_DIR", "")
+RECORD_FORMAT = os.getenv("VOICE_RECORD_FORMAT", "wav").lower()
+RECORD_MAX_MB = float(os.getenv("VOICE_RECORD_MAX_MB", "8"))
 
 # Endpoint WS que Twilio llamará en el <Stream url="...">
 TWILIO_WS_PATH = "/stream/twilio"
 
+# TwiML de /voice/answer: no depende de la petición, se renderiza una vez
+ANSWER_TWIML = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Connect>
+    <Stream url="wss://backend-spainroom.onrender.com{TWILIO_WS_PATH}" />
+  </Connect>
+</Response>""".encode("utf-8")
+
 # ========= APP =========
 app = FastAPI(title="SpainRoom Voice Gateway")
-
-# ========= UTIL: µ-law <-> PCM16 y re-muestreo =========
-MU = 255.0
-
-def mulaw_decode(ulaw_bytes: bytes) -> np.ndarray:
-    """Convierte bytes µ-law (8k) a PCM16 numpy array."""
-    u = np.frombuffer(ulaw_bytes, dtype=np.uint8).astype(np.float32)
-    u = 255.0 - u
-    sign = np.where(u >= 128, -1.0, 1.0)
-    exponent = (u % 128) / 16.0
-    mantissa = (u % 16) / 16.0
-    x = sign * ((1.0 / MU) * ((1.0 + MU) ** (exponent + mantissa) - 1.0))
-    pcm16 = np.clip(x * 32767.0, -32768, 32767).astype(np.int16)
-    return pcm16
-
-def mulaw_encode(pcm16: np.ndarray) -> bytes:
-    """Convierte PCM16 numpy array a bytes µ-law (8k)."""
-    x = np.clip(pcm16.astype(np.float32) / 32768.0, -1.0, 1.0)
-    sign = np.sign(x)
-    y = np.log1p(MU * np.abs(x)) / np.log1p(MU)
-    # Mapear a 8 bits µ-law:
-    # Nota: Implementación simplificada y práctica para voz telefónica
-    u = (1 - (sign < 0).astype(np.uint8)) * 0x7F  # bit de signo
-    mag = (y * 127.0).astype(np.uint8)
-    out = (u & 0x80) | (127 - mag)
-    return out.tobytes()
-
-def resample_linear(x: np.ndarray, src_hz: int, dst_hz: int) -> np.ndarray:
-    if src_hz == dst_hz or x.size == 0:
-        return x
-    ratio = dst_hz / src_hz
-    idx = np.arange(0, int(len(x) * ratio), 1.0) / ratio
-    idx0 = np.floor(idx).astype(int)
-    idx1 = np.minimum(idx0 + 1, len(x) - 1)
-    frac = idx - idx0
-    y = (1.0 - frac) * x[idx0] + frac * x[idx1]
-    return y.astype(x.dtype)
+admission = CallAdmission(MAX_CONCURRENT_CALLS)
+recorder = CallRecorder(RECORD_DIR, RECORD_FORMAT, int(RECORD_MAX_MB * 1024 * 1024)) if RECORD_DIR else None
 
 # ========= RUTAS HTTP =========
 @app.get("/voice/health")
 def health():
     return PlainTextResponse("OK")
 
+@app.get("/voice/metrics")
+def metrics():
+    """Métricas agregadas del worker en formato texto de Prometheus."""
+    gauges = {f"pool_{k}": v for k, v in realtime_pool.stats().items()}
+    gauges.update({f"admission_{k}": v for k, v in admission.stats().items()})
+    if recorder:
+        gauges.update({f"recording_{k}": v for k, v in recorder.stats().items()})
+    return PlainTextResponse(GATEWAY.render(gauges), media_type="text/plain; version=0.0.4")
+
 @app.post("/voice/answer")
-def answer():
+async def answer(request: Request):
     """
     Twilio: A Call Comes In (POST) -> devuelve TwiML que abre el stream WS bidireccional.
+    Si el worker está al límite de llamadas, devuelve TwiML de desborde.
     """
-    twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  <Connect>
-    <Stream url="wss://backend-spainroom.onrender.com{TWILIO_WS_PATH}" />
-  </Connect>
-</Response>"""
-    return Response(content=twiml, media_type="application/xml; charset=utf-8")
+    form = parse_qs((await request.body()).decode("utf-8", "replace"))
+    call_sid = (form.get("CallSid") or [""])[0]
+    if not admission.try_admit(call_sid):
+        twiml = overflow_twiml(OVERFLOW_ACTION, retry_url="/voice/answer", hold_s=OVERFLOW_HOLD_S)
+        return Response(content=twiml, media_type="application/xml; charset=utf-8")
+
+    return Response(content=ANSWER_TWIML, media_type="application/xml; charset=utf-8")
+
+# ========= SESIONES REALTIME (conexión + session.update, con pool) =========
+async def open_realtime():
+    """Abre un WS con OpenAI Realtime y deja la sesión configurada."""
+    openai_headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "OpenAI-Beta": "realtime=v1",
+    }
+    ws_ai = await websockets.connect(OPENAI_REALTIME_URL, extra_headers=openai_headers)
+    # Configuramos la sesión (voz + VAD + instrucciones ES/EN)
+    session_update = {
+        "type": "session.update",
+        "session": {
+            "voice": "verse",  # puedes cambiar: alloy/verse/etc.
+            "instructions": (
+                "Eres 'SpainRoom'. Habla con voz natural. "
+                "Detecta automáticamente si el llamante habla español o inglés y responde SIEMPRE en ese idioma. "
+                "Si el usuario cambia de idioma, cambia tú también. "
+                "Sé breve, amable, permite interrupciones (barge-in) y pide confirmación cuando tomes datos."
+            ),
+            "turn_detection": { "type": "server_vad", "create_response": True }
+        }
+    }
+    if ULAW_PASSTHROUGH:
+        session_update["session"]["input_audio_format"] = "g711_ulaw"
+        session_update["session"]["output_audio_format"] = "g711_ulaw"
+    try:
+        await ws_ai.send(json.dumps(session_update))
+    except Exception:
+        await ws_ai.close()
+        raise
+    return ws_ai
+
+realtime_pool = RealtimePool(open_realtime, POOL_SIZE, POOL_IDLE_S)
+
+@app.on_event("startup")
+async def _start_realtime_pool():
+    if OPENAI_API_KEY and realtime_pool.size > 0:
+        app.state.realtime_pool_task = asyncio.create_task(realtime_pool.run())
+
+@app.on_event("shutdown")
+async def _stop_realtime_pool():
+    task = getattr(app.state, "realtime_pool_task", None)
+    if task:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
+    await realtime_pool.close()
+
+@contextlib.asynccontextmanager
+async def realtime_session():
+    """Sesión del pool si hay una lista; si no, conexión en frío. Se cierra al terminar la llamada."""
+    ws_ai = await realtime_pool.acquire() or await open_realtime()
+    try:
+        yield ws_ai
+    finally:
+        with contextlib.suppress(Exception):
+            await ws_ai.close()
+
+# ========= AUDIO DE LA LLAMADA =========
+class CallAudio:
+    """
+    Transformaciones de audio de una llamada, con su estado (re-muestreadores, buffers).
+    Las usa el gateway y también voice_replay.py, para medir exactamente el mismo código.
+    Las salidas son vistas de buffers internos: válidas hasta la siguiente llamada al mismo método.
+    """
+
+    def __init__(self, metrics: CallMetrics, passthrough: bool = ULAW_PASSTHROUGH):
+        self.metrics = metrics
+        self.passthrough = passthrough
+        # Re-muestreadores con estado y buffers de codec, uno por sentido (sólo en modo transcodificación)
+        if not passthrough:
+            self.up_8k_16k = Resampler(8000, 16000)
+            self.down_16k_8k = Resampler(16000, 8000)
+            self.in_frames = FrameBuffers()
+            self.out_frames = FrameBuffers()
+
+    def to_model(self, ulaw):
+        """Trama µ-law 8k de Twilio -> audio para input_audio_buffer.append."""
+        if self.passthrough:
+            # µ-law 8k sin decodificar
+            return ulaw
+        # µ-law 8k -> PCM16 8k -> PCM16 16k
+        t1 = time.perf_counter()
+        pcm_8k = self.in_frames.decode(ulaw)
+        t2 = time.perf_counter()
+        pcm_16k = self.up_8k_16k.process(pcm_8k)
+        self.metrics.observe("decode", t2 - t1)
+        self.metrics.observe("resample", time.perf_counter() - t2)
+        return pcm_16k
+
+    def to_twilio(self, audio):
+        """Audio de response.audio.delta -> µ-law 8k para Twilio."""
+        if self.passthrough:
+            # µ-law 8k del modelo sin transcodificar
+            return audio
+        # PCM16 16k -> PCM16 8k -> µ-law 8k
+        t0 = time.perf_counter()
+        pcm = np.frombuffer(audio, dtype=np.int16)
+        pcm_8k = self.down_16k_8k.process(pcm)
+        t1 = time.perf_counter()
+        ulaw = self.out_frames.encode(pcm_8k)
+        self.metrics.observe("resample", t1 - t0)
+        self.metrics.observe("encode", time.perf_counter() - t1)
+        return ulaw
 
 # ========= GATEWAY WS: Twilio <-> OpenAI Realtime =========
 @app.websocket(TWILIO_WS_PATH)
@@ -82,6 +226,7 @@ async def twilio_stream(ws_twilio: WebSocket):
     Puentea el audio de la llamada con OpenAI Realtime:
     - Recibe media µ-law 8k de Twilio, lo transforma a PCM16 16k y lo envía al modelo.
     - Recibe audio PCM16 16k del modelo, lo transforma a µ-law 8k y se lo envía a Twilio.
+    - Con ULAW_PASSTHROUGH ambos sentidos van en g711_ulaw y no se toca el audio.
     - Idioma: el modelo detecta y responde en ES/EN automáticamente.
     """
     await ws_twilio.accept()
@@ -96,52 +241,93 @@ async def twilio_stream(ws_twilio: WebSocket):
         return
 
     stream_sid: Optional[str] = None
+    stream_sid_json = "null"  # streamSid ya serializado para la plantilla de media
+    call_sid = ""
 
-    # Conexión WS con OpenAI Realtime
-    openai_headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "OpenAI-Beta": "realtime=v1",
-    }
+    vad = None
+    if VAD_MODE != "off":
+        vad = EnergyVAD(VAD_MODE, VAD_THRESHOLD_DBFS, VAD_HANGOVER_MS, VAD_PREROLL_MS, VAD_THIN_EVERY)
+
+    call_metrics = CallMetrics()
+    call_audio = CallAudio(call_metrics)
+    capture: Optional[CaptureWriter] = None
+    recording: Optional[CallRecording] = None
+    call_stats = {}
 
     try:
-        async with websockets.connect(OPENAI_REALTIME_URL, extra_headers=openai_headers) as ws_ai:
-            # Configuramos la sesión (voz + VAD + instrucciones ES/EN)
-            session_update = {
-                "type": "session.update",
-                "session": {
-                    "voice": "verse",  # puedes cambiar: alloy/verse/etc.
-                    "instructions": (
-                        "Eres 'SpainRoom'. Habla con voz natural. "
-                        "Detecta automáticamente si el llamante habla español o inglés y responde SIEMPRE en ese idioma. "
-                        "Si el usuario cambia de idioma, cambia tú también. "
-                        "Sé breve, amable, permite interrupciones (barge-in) y pide confirmación cuando tomes datos."
-                    ),
-                    "turn_detection": { "type": "server_vad", "create_response": True }
-                }
-            }
-            await ws_ai.send(json.dumps(session_update))
-
-            # Tarea que escucha al modelo y reenvía audio a Twilio
+        async with realtime_session() as ws_ai:
+            in_bpms = 8 if ULAW_PASSTHROUGH else 32  # bytes/ms hacia el modelo: µ-law 8k | PCM16 16k
+
+            # JSON por plantilla: el base64 no necesita escape y así no se crea un dict por mensaje
+            def encode_append(chunk) -> str:
+                return f'{{"type":"input_audio_buffer.append","audio":"{b64_text(chunk)}"}}'
+
+            def encode_media(chunk) -> str:
+                # Se llama al enviar: sólo se graba el audio del agente que sale hacia Twilio
+                if recording:
+                    recording.agent(chunk)
+                return f'{{"event":"media","streamSid":{stream_sid_json},"media":{{"payload":"{b64_text(chunk)}"}}}}'
+
+            # Productor/consumidor por sentido: recibir nunca espera al envío del otro WS
+            to_ai = LegQueue("ai", ws_ai.send, encode_append,
+                             QUEUE_MAX_ITEMS, QUEUE_MAX_MS * in_bpms, QUEUE_POLICY,
+                             on_send=lambda s: call_metrics.observe("send_to_model", s))
+            playback = PlaybackTracker()
+
+            # <mark> detrás de cada bloque de audio que sale de verdad (tras fusiones y descartes)
+            def encode_mark(item_id, nbytes) -> Optional[str]:
+                name = playback.on_sent(item_id, nbytes)
+                if name is None:
+                    return None
+                return json.dumps({"event": "mark", "streamSid": stream_sid, "mark": {"name": name}})
+
+            to_twilio = LegQueue("twilio", ws_twilio.send_text, encode_media,
+                                 QUEUE_MAX_ITEMS, QUEUE_MAX_MS * 8, QUEUE_POLICY,
+                                 on_send=lambda s: call_metrics.observe("send_to_twilio", s),
+                                 encode_mark=encode_mark)
+            coalescer = FrameCoalescer(APPEND_WINDOW_MS, in_bpms, to_ai.put_audio)
+            bg_tasks = [asyncio.create_task(c) for c in (to_ai.run(), to_twilio.run(), coalescer.run_timer())]
+
+            # Tarea que escucha al modelo y encola audio hacia Twilio
             async def forward_ai_to_twilio():
                 try:
                     async for raw in ws_ai:
                         evt = json.loads(raw)
                         t = evt.get("type")
 
-                        if t == "response.audio.delta":
-                            # Audio PCM16 16k -> µ-law 8k -> base64 -> Twilio
-                            chunk_pcm16 = base64.b64decode(evt["audio"])
-                            pcm = np.frombuffer(chunk_pcm16, dtype=np.int16)
-                            pcm_8k = resample_linear(pcm, 16000, 8000)
-                            ulaw = mulaw_encode(pcm_8k)
-                            payload = base64.b64encode(ulaw).decode()
-
-                            if stream_sid:
-                                await ws_twilio.send_text(json.dumps({
-                                    "event": "media",
-                                    "streamSid": stream_sid,
-                                    "media": {"payload": payload}
-                                }))
+                        if t == "response.audio.delta" and stream_sid:
+                            item_id = evt.get("item_id") or ""
+                            if playback.is_cut(item_id):
+                                # Respuesta interrumpida por el llamante: nadie la va a oír
+                                continue
+                            call_metrics.model_delta()
+                            audio = b64_bytes(evt.get("delta") or evt.get("audio") or "")
+                            if capture:
+                                capture.write(KIND_MODEL_DELTA, audio)
+                            ulaw = call_audio.to_twilio(audio)
+                            call_metrics.frame_out(len(ulaw))
+                            playback.on_queued(item_id)
+                            # El audio lleva su <mark> (ver encode_mark): se fusiona o descarta con él
+                            await to_twilio.put_audio(ulaw, tag=item_id)
+
+                        elif t == "input_audio_buffer.speech_started" and stream_sid:
+                            # Barge-in: cortar lo que Twilio aún no ha reproducido y truncar el item en el modelo
+                            cut = playback.interrupt(to_twilio.audio_bytes)
+                            if cut:
+                                item_id, played_ms = cut
+                                to_twilio.clear_audio()
+                                if recording:
+                                    recording.clear()
+                                to_twilio.put_control(json.dumps({"event": "clear", "streamSid": stream_sid}), urgent=True)
+                                to_ai.put_control(json.dumps({
+                                    "type": "conversation.item.truncate",
+                                    "item_id": item_id,
+                                    "content_index": 0,
+                                    "audio_end_ms": played_ms
+                                }), urgent=True)
+
+                        elif t == "input_audio_buffer.speech_stopped":
+                            call_metrics.speech_stopped()
 
                         # (Opcional) logs/diagnóstico:
                         # elif t in ("response.created","response.completed","input_audio_buffer.collected"):
@@ -160,38 +346,64 @@ async def twilio_stream(ws_twilio: WebSocket):
             try:
                 while True:
                     msg_text = await ws_twilio.receive_text()
+                    t0 = time.perf_counter()
                     msg = json.loads(msg_text)
                     ev = msg.get("event")
 
                     if ev == "start":
                         stream_sid = msg["start"]["streamSid"]
+                        stream_sid_json = json.dumps(stream_sid)
+                        call_sid = msg["start"].get("callSid") or ""
+                        admission.connected(call_sid)
+                        if recorder:
+                            recording = recorder.open(os.path.join(time.strftime("%Y%m%d"), stream_sid))
+                        if CAPTURE_DIR:
+                            try:
+                                capture = CaptureWriter(
+                                    os.path.join(CAPTURE_DIR, f"{stream_sid}.vcap"),
+                                    {"stream_sid": stream_sid, "call_sid": call_sid,
+                                     "passthrough": ULAW_PASSTHROUGH, "started": time.time()})
+                            except OSError as e:
+                                print("[VOICE] captura desactivada:", e)
 
                     elif ev == "media":
-                        # Twilio -> µ-law 8k (b64) -> PCM16 8k -> PCM16 16k -> b64 -> modelo
-                        ulaw_b64 = msg["media"]["payload"]
-                        ulaw = base64.b64decode(ulaw_b64)
-                        pcm_8k = mulaw_decode(ulaw)
-                        pcm_16k = resample_linear(pcm_8k, 8000, 16000)
-                        await ws_ai.send(json.dumps({
-                            "type": "input_audio_buffer.append",
-                            "audio": base64.b64encode(pcm_16k.tobytes()).decode()
-                        }))
+                        ulaw = b64_bytes(msg["media"]["payload"])
+                        t1 = time.perf_counter()
+                        call_metrics.observe("twilio_receive", t1 - t0)
+                        call_metrics.frame_in(len(ulaw))
+                        if capture:
+                            capture.write(KIND_TWILIO_MEDIA, ulaw)
+                        if recording:
+                            recording.caller(ulaw)
+                        # VAD: el silencio fuera del hangover no llega al modelo (ni se transcodifica)
+                        for ulaw in (vad.feed(ulaw) if vad else (ulaw,)):
+                            # Twilio -> (transcodificación) -> agrupador -> modelo
+                            await coalescer.push(call_audio.to_model(ulaw))
 
                     elif ev == "mark":
-                        # Ignorado (marcas de sincronización de Twilio)
-                        pass
+                        # Twilio ya reprodujo el audio hasta esta marca
+                        playback.on_mark((msg.get("mark") or {}).get("name", ""))
 
                     elif ev == "stop":
+                        await coalescer.flush()
+                        await to_ai.drain()
                         break
 
             except WebSocketDisconnect:
                 # Twilio colgó
                 pass
             finally:
-                # Cancelar la tarea lectora del modelo
-                ai_task.cancel()
-                with contextlib.suppress(Exception):
-                    await ai_task
+                # Cancelar la tarea lectora del modelo, los envíos y el temporizador del agrupador
+                for task in (ai_task, *bg_tasks):
+                    task.cancel()
+                for task in (ai_task, *bg_tasks):
+                    with contextlib.suppress(asyncio.CancelledError, Exception):
+                        await task
+                call_stats.update({"to_model": to_ai.stats(), "to_twilio": to_twilio.stats(),
+                                   "barge_in": playback.stats()})
+                if vad:
+                    call_stats["vad"] = vad.stats()
+                    GATEWAY.counters["vad_frames_suppressed_total"] += vad.frames_suppressed
 
     except Exception as e:
         # Error al conectar con el Realtime o durante el puente
@@ -202,3 +414,12 @@ async def twilio_stream(ws_twilio: WebSocket):
         finally:
             with contextlib.suppress(Exception):
                 await ws_twilio.close()
+    finally:
+        admission.release(call_sid)
+        if capture:
+            capture.close()
+        if recording:
+            recording.close()
+            call_stats["recording"] = recording.stats()
+        call_stats["metrics"] = call_metrics.close()
+        print("[VOICE] fin", stream_sid, json.dumps(call_stats))
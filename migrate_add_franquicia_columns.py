@@ -0,0 +1,74 @@
+# migrate_add_franquicia_columns.py
+# Añade a las tablas de plazas de franquicia las columnas nuevas que db.create_all() no crea
+# en tablas ya existentes. Usa DATABASE_URL (Postgres) o sqlite:///app.db, como config.Config.
+import importlib
+import os
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from config import Config
+
+# services usa imports relativos (.models): se importa como paquete, igual que los bench
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+services = importlib.import_module(f"{os.path.basename(ROOT)}.services")
+
+engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+print(f"Usando base de datos: {engine.url.render_as_string(hide_password=True)}")
+
+cols = {
+    "franquicia_slots": [
+        ("source_hash", "VARCHAR(16)"),
+        ("ocupadas", "INTEGER NOT NULL DEFAULT 0"),
+        ("provincia_norm", "VARCHAR(120)"),
+        ("nombre_norm", "VARCHAR(370)"),
+    ],
+    "franquicia_etl_jobs": [
+        ("full_scan", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+}
+
+# Columnas que hay que calcular al crearlas
+backfill = {
+    ("franquicia_slots", "ocupadas"): """
+        UPDATE franquicia_slots SET ocupadas = (
+          SELECT COALESCE(SUM(o.ocupado), 0) FROM franquicia_ocupacion o
+          WHERE o.provincia = franquicia_slots.provincia AND o.municipio = franquicia_slots.municipio
+            AND o.nivel = franquicia_slots.nivel AND o.distrito = franquicia_slots.distrito
+        )
+    """,
+}
+
+insp = inspect(engine)
+q = engine.dialect.identifier_preparer.quote  # nombres entre comillas si el motor lo exige (palabras reservadas)
+with engine.begin() as conn:
+    for table, wanted in cols.items():
+        if not insp.has_table(table):
+            print(f"   (no existe '{table}': la crea db.create_all())")
+            continue
+        print(f"Comprobando columnas en '{table}'...")
+        existing = {c["name"] for c in insp.get_columns(table)}
+        for name, decl in wanted:
+            if name in existing:
+                print(f"   ok: {name} existe")
+                continue
+            sql = f"ALTER TABLE {q(table)} ADD COLUMN {q(name)} {decl}"
+            print(" ->", sql)
+            conn.execute(text(sql))
+            if (table, name) in backfill:
+                print(" -> rellenando", name)
+                conn.execute(text(backfill[table, name]))
+
+# Índices de prefijo y de paginación; columnas normalizadas y FTS5/pg_trgm (services.setup_search).
+# CREATE EXTENSION pg_trgm requiere permisos de propietario de la BD: se hace aquí, no al servir.
+with engine.begin() as conn:
+    if inspect(engine).has_table("franquicia_slots"):
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_franquicia_slots_nombre_norm ON franquicia_slots (nombre_norm)"))
+        print("   ok: ix_franquicia_slots_nombre_norm")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_franq_slot_orden ON franquicia_slots (provincia, municipio, distrito, id)"))
+        print("   ok: ix_franq_slot_orden")
+        r = services.setup_search(conn)
+        print(f"   ok: búsqueda ({r['dialect']}), {r['backfilled']} filas normalizadas")
+
+print("Migración completada ✅")
@@ -16,9 +16,15 @@ class FranquiciaSlots(db.Model):
     distrito = db.Column(db.String(180), nullable=False, default="")
     poblacion = db.Column(db.Integer, nullable=False, default=0)
     slots = db.Column(db.Integer, nullable=False, default=0)
+    source_hash = db.Column(db.String(16), nullable=True)  # hash del dato de origen (rebuild incremental)
+    ocupadas = db.Column(db.Integer, nullable=False, default=0)  # = SUM(franquicia_ocupacion.ocupado) del grupo
+    # Búsqueda sin tildes ni artículo inicial (services.search_norm); nombre = "municipio [distrito]"
+    provincia_norm = db.Column(db.String(120), nullable=True)
+    nombre_norm = db.Column(db.String(370), nullable=True, index=True)
 
     __table_args__ = (
         db.UniqueConstraint("provincia", "municipio", "nivel", "distrito", name="uq_franq_slot"),
+        db.Index("ix_franq_slot_orden", "provincia", "municipio", "distrito", "id"),  # paginación de /slots
     )
 
 class FranquiciaOcupacion(db.Model):
@@ -35,3 +41,34 @@ class FranquiciaOcupacion(db.Model):
     __table_args__ = (
         db.UniqueConstraint("provincia", "municipio", "nivel", "distrito", "slot_index", name="uq_franq_occ"),
     )
+
+class FranquiciaEtlJob(db.Model):
+    """Rebuild desde CSV en segundo plano: progreso y checkpoint (siguiente bloque) para reanudar."""
+    __tablename__ = "franquicia_etl_jobs"
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    estado = db.Column(db.String(20), nullable=False, default="en_cola")  # en_cola | ejecutando | completado | error
+    preserve = db.Column(db.Integer, nullable=False, default=1)  # 0/1
+    full_scan = db.Column(db.Integer, nullable=False, default=0)  # 0/1: ignora los hashes de origen
+    chunk_rows = db.Column(db.Integer, nullable=False)
+    next_chunk = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    groups_created = db.Column(db.Integer, nullable=False, default=0)
+    groups_touched = db.Column(db.Integer, nullable=False, default=0)
+    created_slots = db.Column(db.Integer, nullable=False, default=0)
+    elapsed_s = db.Column(db.Float, nullable=False, default=0.0)
+    error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.Float, nullable=True)   # epoch (s)
+    finished_at = db.Column(db.Float, nullable=True)
+
+class FranquiciaEtlLock(db.Model):
+    """Cerrojo del rebuild (fila única id=1): un job lo reclama con un UPDATE condicional y lo renueva por bloque."""
+    __tablename__ = "franquicia_etl_lock"
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), nullable=True)   # None = libre
+    heartbeat = db.Column(db.Float, nullable=True)     # epoch (s) de la última renovación
+
+class FranquiciaDataVersion(db.Model):
+    """Versión de los datos de plazas (fila única id=1): la suben las escrituras, la comparan las cachés."""
+    __tablename__ = "franquicia_data_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
@@ -1,9 +1,14 @@
 
-import os
-from flask import Blueprint, jsonify, request
+import os, hashlib, threading
+from collections import OrderedDict
+import click
+from flask import Blueprint, Response, current_app, jsonify, request
 from .services import (
-    summary_totals, query_slots, get_group_occupancy,
-    rebuild_from_csv, ocupar_slot, liberar_slot
+    data_version, summary_totals, query_slots, get_group_occupancy, autocomplete,
+    SLOTS_PAGE_DEFAULT,
+    ocupar_slot, liberar_slot, check_ocupadas,
+    ETL_CHUNK_ROWS, plan_rebuild, start_rebuild_job, resume_rebuild_job, get_rebuild_job,
+    setup_search
 )
 
 bp_franquicia = Blueprint("franquicia", __name__)
@@ -21,16 +26,69 @@ def _guard():
     if not _admin_only():
         return jsonify(error="forbidden"), 403
 
+# ========= Caché de /summary y /slots =========
+# Respuestas por filtro, etiquetadas con la versión de datos de la BD (services.data_version).
+# Cualquier escritura sube la versión: cada worker descarta lo suyo al ver la nueva, sin
+# coordinación. Por petición queda una lectura por clave primaria; la ETag (versión + filtro)
+# permite al panel revalidar con If-None-Match y recibir 304 sin cuerpo.
+CACHE_MAX = int(os.getenv("FRANQ_CACHE_MAX", "512"))
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # filtro -> (versión, cuerpo JSON)
+_cache_lock = threading.Lock()
+
+def _cached_json(key: tuple, compute):
+    version = data_version()
+    etag = f"v{version}-{hashlib.blake2b(repr(key).encode('utf-8'), digest_size=6).hexdigest()}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        with _cache_lock:
+            hit = _cache.get(key)
+            if hit is not None and hit[0] == version:
+                _cache.move_to_end(key)
+        if hit is not None and hit[0] == version:
+            body = hit[1]
+        else:
+            body = current_app.json.dumps(compute())
+            with _cache_lock:
+                _cache[key] = (version, body)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_MAX:
+                    _cache.popitem(last=False)
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # el navegador revalida siempre (barato: 304)
+    return resp
+
 @bp_franquicia.get("/summary")
 def get_summary():
-    return jsonify(summary_totals())
+    return _cached_json(("summary",), summary_totals)
 
 @bp_franquicia.get("/slots")
 def list_slots():
+    """?limit=&after=<next> pagina por cursor; ?total=true añade el total de grupos que casan."""
     provincia = request.args.get("provincia") or None
     estado = (request.args.get("estado") or "todas").lower()
     q = request.args.get("q") or None
-    return jsonify(query_slots(provincia=provincia, estado=estado, q=q))
+    after = request.args.get("after") or None
+    with_total = (request.args.get("total","false").lower() == "true")
+    try:
+        limit = int(request.args.get("limit", SLOTS_PAGE_DEFAULT))
+        return _cached_json(("slots", provincia, estado, q, limit, after, with_total),
+                            lambda: query_slots(provincia=provincia, estado=estado, q=q,
+                                                limit=limit, after=after, with_total=with_total))
+    except ValueError:
+        return jsonify(error="paginacion_invalida"), 400
+
+@bp_franquicia.get("/slots/autocomplete")
+def slots_autocomplete():
+    q = request.args.get("q") or ""
+    provincia = request.args.get("provincia") or None
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify(error="limit_invalido"), 400
+    return _cached_json(("autocomplete", q, provincia, limit),
+                        lambda: autocomplete(q, limit=limit, provincia=provincia))
 
 @bp_franquicia.get("/slots/<int:slot_group_id>/ocupacion")
 def slot_group_occupancy(slot_group_id: int):
@@ -63,11 +121,61 @@ def liberar():
     code = 200 if r.get("ok") else 400
     return jsonify(r), code
 
+@bp_franquicia.get("/ocupadas/check")
+def ocupadas_check():
+    return jsonify(check_ocupadas(repair=False))
+
+@bp_franquicia.post("/ocupadas/repair")
+def ocupadas_repair():
+    return jsonify(check_ocupadas(repair=True))
+
+# flask franquicia check-ocupadas [--repair]
+@bp_franquicia.cli.command("check-ocupadas")
+@click.option("--repair", is_flag=True, help="corrige franquicia_slots.ocupadas")
+def ocupadas_check_command(repair: bool):
+    r = check_ocupadas(repair=repair)
+    for item in r["items"]:
+        click.echo(f"{item['provincia']} / {item['municipio']} / {item['nivel']} / {item['distrito']}: "
+                   f"ocupadas={item['ocupadas']} real={item['real']}")
+    click.echo(f"descuadres: {r['descuadres']}" + (" (reparados)" if r["reparado"] else ""))
+
+# flask franquicia setup-search (también lo hace migrate_add_franquicia_columns.py)
+@bp_franquicia.cli.command("setup-search")
+def setup_search_command():
+    from .models import db
+    with db.engine.begin() as conn:
+        r = setup_search(conn)
+    click.echo(f"búsqueda preparada ({r['dialect']}): {r['backfilled']} filas normalizadas")
+
 @bp_franquicia.post("/etl/rebuild")
 def etl_rebuild():
+    """
+    Lanza el rebuild en segundo plano (202 + job_id); el progreso en GET /etl/rebuild/<job_id>.
+    ?dry_run=true devuelve el diff planificado sin escribir; ?full=true ignora los hashes de origen.
+    """
     preserve = (request.args.get("preserve","true").lower() != "false")
+    full = (request.args.get("full","false").lower() == "true")
     try:
-        r = rebuild_from_csv(preserve_occupations=preserve)
-        return jsonify(r)
+        chunk = int(request.args.get("chunk", ETL_CHUNK_ROWS))
+        if request.args.get("dry_run","false").lower() == "true":
+            return jsonify(plan_rebuild(preserve_occupations=preserve, full=full, chunk_rows=chunk,
+                                        limit=int(request.args.get("limit", 200))))
+        r = start_rebuild_job(current_app._get_current_object(), preserve_occupations=preserve,
+                              chunk_rows=chunk, full=full)
     except Exception as e:
         return jsonify(ok=False, error=str(e)), 400
+    return jsonify(r), (202 if r.get("ok") else 409)
+
+@bp_franquicia.get("/etl/rebuild/<job_id>")
+def etl_rebuild_status(job_id: str):
+    job = get_rebuild_job(job_id)
+    if not job:
+        return jsonify(ok=False, error="job_no_existe"), 404
+    return jsonify(ok=True, job=job)
+
+@bp_franquicia.post("/etl/rebuild/<job_id>/resume")
+def etl_rebuild_resume(job_id: str):
+    r = resume_rebuild_job(current_app._get_current_object(), job_id)
+    if r.get("ok"):
+        return jsonify(r), 202
+    return jsonify(r), (404 if r.get("error") == "job_no_existe" else 409)
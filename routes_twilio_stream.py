@@ -3,20 +3,49 @@
 import os
 from flask import Blueprint, request, make_response, jsonify, current_app
 
+from voice_events import DEFAULT_DB_PATH, CallEventSink
+
 bp_twilio_stream = Blueprint("twilio_stream", __name__)
 
 # URL del WebSocket de tu servicio voice-cr
 VOICE_CR_WS_URL = (os.getenv("VOICE_CR_WS_URL") or "wss://voice-cr.onrender.com/cr").strip()
 
+# Callbacks de estado -> cola en memoria -> SQLite por lotes (voice_events)
+CALL_EVENTS = CallEventSink(
+    os.getenv("CALL_EVENTS_DB", DEFAULT_DB_PATH),
+    batch=int(os.getenv("CALL_EVENTS_BATCH", "500")),
+    max_pending=int(os.getenv("CALL_EVENTS_MAX_PENDING", "10000")),
+)
+
 # (Opcional) callback de estado de llamada
 @bp_twilio_stream.route("/twilio/voice/status", methods=["POST"])
 def twilio_status():
-    try:
-        current_app.logger.info("[TWILIO STATUS] %s", dict(request.form))
-    except Exception:
-        pass
+    if not CALL_EVENTS.submit(request.form.to_dict()):
+        current_app.logger.warning("[TWILIO STATUS] cola llena, evento descartado (%s)", request.form.get("CallSid"))
     return ("", 204)
 
+# Campos del callback que devuelve la línea de tiempo; el resto (From/To, Caller*/Called*
+# con ciudad, provincia y CP) son datos personales y se quedan en la BD.
+TIMELINE_FIELDS = ("CallStatus", "CallbackSource", "Direction", "CallDuration", "Duration",
+                   "SipResponseCode", "Timestamp", "ApiVersion")
+
+def _admin_only():
+    """Requiere X-Admin-Key == ADMIN_API_KEY; sin clave configurada no se sirve nada."""
+    api_key = os.getenv("ADMIN_API_KEY", "")
+    return bool(api_key) and request.headers.get("X-Admin-Key") == api_key
+
+# Línea de tiempo de una llamada (eventos de estado en orden)
+@bp_twilio_stream.route("/twilio/voice/calls/<call_sid>/timeline", methods=["GET"])
+def call_timeline(call_sid):
+    if not _admin_only():
+        return jsonify(error="forbidden"), 403
+    events = CALL_EVENTS.timeline(call_sid)
+    if not events:
+        return jsonify({"error": "Sin eventos para esa llamada", "call_sid": call_sid}), 404
+    for e in events:
+        e["data"] = {k: v for k, v in e["data"].items() if k in TIMELINE_FIELDS}
+    return jsonify({"call_sid": call_sid, "events": events, "sink": CALL_EVENTS.stats()})
+
 @bp_twilio_stream.route("/twilio/voice/stream", methods=["POST"])
 def voice_stream():
     """
@@ -1,15 +1,30 @@
 # routes_voice_answer_cr.py — Twilio Voice → ConversationRelay (voice-cr)
 # Nora · 2025-10-14
 import os
+from functools import lru_cache
 from flask import Blueprint, request, make_response, jsonify
+from voice_admission import DEFAULT_DB_PATH, SQLiteCallAdmission, overflow_twiml
+from voice_twiml import xml_escape
 
 bp_voice_answer_cr = Blueprint("voice_answer_cr", __name__)
 
+# Límite de llamadas (0 = sin límite); mismo criterio que el gateway (main.py). Las plazas van en
+# SQLite compartido: /voice/answer_cr y /voice/answer_cr/done pueden caer en workers distintos.
+admission = SQLiteCallAdmission(int(os.getenv("VOICE_MAX_CONCURRENT_CALLS", "0")),
+                                os.getenv("VOICE_ADMISSION_DB", DEFAULT_DB_PATH))
+
+# CallStatus finales: la llamada ya no ocupa plaza
+FINAL_STATUSES = {"completed", "busy", "failed", "no-answer", "canceled"}
+
 def env(k, default=""):
     return os.getenv(k, default)
 
-def _twiml_cr():
-    """Construye TwiML <ConversationRelay> apuntando al WS del servicio VOZ (voice-cr)."""
+@lru_cache(maxsize=1)
+def _twiml_cr() -> bytes:
+    """
+    Construye TwiML <ConversationRelay> apuntando al WS del servicio VOZ (voice-cr).
+    Se renderiza una vez por proceso: la configuración sale del entorno, que no cambia en caliente.
+    """
     ws_url     = env("VOICE_WS_URL", "").strip() or "wss://INVALID-WS-URL"
     lang       = env("CR_LANGUAGE", "es-ES").strip()
     trans_lang = env("CR_TRANSCRIPTION_LANGUAGE", lang).strip()
@@ -18,36 +33,59 @@ def _twiml_cr():
     welcome    = env("CR_WELCOME", "").strip()
 
     attrs = [
-        f'url="{ws_url}"',
-        f'language="{lang}"',
-        f'transcriptionLanguage="{trans_lang}"',
-        f'ttsProvider="{tts}"',
+        f'url="{xml_escape(ws_url)}"',
+        f'language="{xml_escape(lang)}"',
+        f'transcriptionLanguage="{xml_escape(trans_lang)}"',
+        f'ttsProvider="{xml_escape(tts)}"',
         'interruptible="speech"',
         'reportInputDuringAgentSpeech="none"',
     ]
     if welcome:
-        attrs.append(f'welcomeGreeting="{welcome}"')
+        attrs.append(f'welcomeGreeting="{xml_escape(welcome)}"')
     if voice:
-        attrs.append(f'voice="{voice}"')
+        attrs.append(f'voice="{xml_escape(voice)}"')
 
     # TwiML final
     twiml = f'''<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-  <Connect>
+  <Connect action="/voice/answer_cr/done">
     <ConversationRelay {' '.join(attrs)} />
   </Connect>
 </Response>'''
-    return twiml
+    return twiml.encode("utf-8")
+
+def _answer(retry_url):
+    """TwiML de ConversationRelay si hay plaza; si no, TwiML de desborde."""
+    call_sid = request.values.get("CallSid", "")
+    if not admission.try_admit(call_sid):
+        action = env("VOICE_OVERFLOW_ACTION", "dial").lower()
+        twiml = overflow_twiml(action, retry_url=retry_url, hold_s=int(env("VOICE_OVERFLOW_HOLD_S", "15")))
+        return make_response(twiml, 200, {"Content-Type": "application/xml"})
+    admission.connected(call_sid)
+    return make_response(_twiml_cr(), 200, {"Content-Type": "application/xml"})
 
 @bp_voice_answer_cr.route("/voice/answer_cr", methods=["GET","POST"])
 def voice_answer_cr():
     """Webhook Twilio (A CALL COMES IN) → ConversationRelay hacia voice-cr."""
-    return make_response(_twiml_cr(), 200, {"Content-Type": "application/xml"})
+    return _answer("/voice/answer_cr")
 
 @bp_voice_answer_cr.route("/voice/fallback", methods=["GET","POST"])
 def voice_fallback():
     """Fallback opcional (mismo TwiML)."""
-    return make_response(_twiml_cr(), 200, {"Content-Type": "application/xml"})
+    return _answer("/voice/fallback")
+
+@bp_voice_answer_cr.route("/voice/answer_cr/done", methods=["GET","POST"])
+def voice_answer_cr_done():
+    """Action de <Connect>: la sesión de ConversationRelay ha terminado, libera la plaza."""
+    admission.release(request.values.get("CallSid", ""))
+    return make_response('<?xml version="1.0" encoding="UTF-8"?>\n<Response/>', 200, {"Content-Type": "application/xml"})
+
+@bp_voice_answer_cr.route("/voice/answer_cr/status", methods=["POST"])
+def voice_answer_cr_status():
+    """Status callback del número: libera la plaza si la llamada acaba sin pasar por el action (cuelgue, fallo)."""
+    if request.values.get("CallStatus", "") in FINAL_STATUSES:
+        admission.release(request.values.get("CallSid", ""))
+    return ("", 204)
 
 @bp_voice_answer_cr.route("/diag_runtime", methods=["GET"])
 def diag_runtime():
@@ -59,4 +97,6 @@ def diag_runtime():
         "CR_VOICE",
         "CR_WELCOME",
     ]
-    return jsonify({k: env(k, "") for k in keys})
+    out = {k: env(k, "") for k in keys}
+    out["admission"] = admission.stats()
+    return jsonify(out)
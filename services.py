@@ -1,9 +1,12 @@
 
-import os, math, csv
+import os, math, csv, base64, hashlib, json, re, threading, time, unicodedata, uuid
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 
-from .models import db, FranquiciaSlots, FranquiciaOcupacion
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, FranquiciaSlots, FranquiciaOcupacion, FranquiciaEtlJob, FranquiciaEtlLock, FranquiciaDataVersion
 
 THRESH_1 = int(os.getenv("PLAZAS_THRESH_1", "10000"))
 THRESH_2 = int(os.getenv("PLAZAS_THRESH_2", "20000"))
@@ -18,32 +21,71 @@ def _rule_slots_municipio(pop: int) -> int:
     else:
         return math.ceil(pop / DISTRICT_RATIO)
 
-def _read_csv(path: Path) -> List[Dict[str, Any]]:
+# ========= Versión de datos =========
+def data_version() -> int:
+    """Versión actual de los datos de plazas (0 si nunca se ha escrito)."""
+    return db.session.query(FranquiciaDataVersion.version).filter_by(id=1).scalar() or 0
+
+def _bump_version() -> None:
+    """Sube la versión dentro de la transacción en curso: se confirma (o no) con la escritura."""
+    V = FranquiciaDataVersion
+    if V.query.filter_by(id=1).update({"version": V.version + 1}, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(V(id=1, version=1))
+    except IntegrityError:
+        # Otro worker creó la fila a la vez
+        V.query.filter_by(id=1).update({"version": V.version + 1}, synchronize_session=False)
+
+def _iter_csv(path: Path) -> Iterator[Dict[str, Any]]:
+    """Filas del CSV una a una (sin cargar el fichero entero)."""
     with path.open("r", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+        yield from csv.DictReader(f)
 
-def rebuild_from_csv(preserve_occupations: bool = True) -> Dict[str, Any]:
+def _municipios_csv() -> Path:
     mun_csv = DATA_DIR / "municipios_es.csv"
     if not mun_csv.exists():
         raise FileNotFoundError(f"No existe {mun_csv.as_posix()}")
+    return mun_csv
 
-    municipios = _read_csv(mun_csv)
-
+def _district_index() -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Distritos por (provincia, ciudad). Sólo las ciudades grandes: es el único CSV que se indexa entero."""
     dist_csv = DATA_DIR / "distritos_es.csv"
-    distritos = _read_csv(dist_csv) if dist_csv.exists() else []
+    idx_d: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    if dist_csv.exists():
+        for d in _iter_csv(dist_csv):
+            idx_d.setdefault((d.get("provincia",""), d.get("ciudad","")), []).append(d)
+    return idx_d
 
-    idx_d = {}
-    for d in distritos:
-        key = (d.get("provincia",""), d.get("ciudad",""))
-        idx_d.setdefault(key, []).append(d)
+# ========= Rebuild por lotes =========
+# Filas por executemany al aplicar el diff
+REBUILD_BATCH = int(os.getenv("PLAZAS_REBUILD_BATCH", "5000"))
+# Municipios por bloque (un commit por bloque)
+ETL_CHUNK_ROWS = int(os.getenv("PLAZAS_ETL_CHUNK", "1000"))
 
-    if not preserve_occupations:
-        FranquiciaOcupacion.query.delete()
-        FranquiciaSlots.query.delete()
-        db.session.commit()
+GroupKey = Tuple[str, str, str, str]  # (provincia, municipio, nivel, distrito) = uq_franq_slot
 
-    total_groups = 0
-    created_slots = 0
+# Parámetros de la regla de plazas: si cambian, cambia el hash de todos los grupos
+_RULES = f"{THRESH_1}|{THRESH_2}|{DISTRICT_RATIO}"
+
+def _source_hash(key: GroupKey, poblacion: int) -> str:
+    """Hash del dato de origen del grupo (clave + población) y de la regla que calcula sus plazas."""
+    src = "\x1f".join((_RULES, *key, str(poblacion)))
+    return hashlib.blake2b(src.encode("utf-8"), digest_size=8).hexdigest()
+
+def _plan_groups(municipios: Iterable[Dict[str, Any]], idx_d: Dict[Tuple[str, str], List[Dict[str, Any]]]):
+    """
+    Grupos que piden estas filas: {clave: (poblacion, slots, hash)} (si una clave se repite gana la
+    última aparición, como al actualizar fila a fila) y {clave: slot_index máximo} para las ocupaciones.
+    """
+    groups: Dict[GroupKey, Tuple[int, int, str]] = {}
+    max_index: Dict[GroupKey, int] = {}
+
+    def want(key: GroupKey, poblacion: int, slots: int) -> None:
+        groups[key] = (poblacion, slots, _source_hash(key, poblacion))
+        if slots > max_index.get(key, 0):
+            max_index[key] = slots
 
     for m in municipios:
         provincia = (m.get("provincia") or "").strip()
@@ -54,7 +96,6 @@ def rebuild_from_csv(preserve_occupations: bool = True) -> Dict[str, Any]:
             poblacion = -1
 
         dlist = idx_d.get((provincia, municipio), [])
-
         if dlist:
             for d in dlist:
                 distrito = (d.get("distrito") or "").strip()
@@ -62,97 +103,588 @@ def rebuild_from_csv(preserve_occupations: bool = True) -> Dict[str, Any]:
                     pob_d = int(float(d.get("poblacion", "0") or 0))
                 except Exception:
                     pob_d = 0
-                slots = max(1, math.ceil(pob_d / DISTRICT_RATIO))
-                group = FranquiciaSlots.query.filter_by(provincia=provincia, municipio=municipio, nivel="distrito", distrito=distrito).first()
-                if not group:
-                    group = FranquiciaSlots(provincia=provincia, municipio=municipio, nivel="distrito", distrito=distrito, poblacion=pob_d, slots=slots)
-                    db.session.add(group)
-                    total_groups += 1
-                else:
-                    group.poblacion = pob_d
-                    group.slots = slots
-                db.session.flush()
-
-                for i in range(1, slots+1):
-                    occ = FranquiciaOcupacion.query.filter_by(provincia=provincia, municipio=municipio, nivel="distrito", distrito=distrito, slot_index=i).first()
-                    if not occ:
-                        occ = FranquiciaOcupacion(provincia=provincia, municipio=municipio, nivel="distrito", distrito=distrito, slot_index=i, ocupado=0, ocupado_por=None)
-                        db.session.add(occ)
-                        created_slots += 1
+                want((provincia, municipio, "distrito", distrito), pob_d, max(1, math.ceil(pob_d / DISTRICT_RATIO)))
+        else:
+            want((provincia, municipio, "municipio", ""), poblacion, _rule_slots_municipio(poblacion if poblacion >= 0 else 0))
+    return groups, max_index
+
+def _load_groups(keys) -> Dict[GroupKey, Tuple[int, int, Optional[str]]]:
+    """Grupos ya creados en BD de esos municipios: {clave: (poblacion, slots, source_hash)}."""
+    S = FranquiciaSlots
+    return {
+        (r[0], r[1], r[2], r[3]): (r[4], r[5], r[6])
+        for r in db.session.execute(
+            db.select(S.provincia, S.municipio, S.nivel, S.distrito, S.poblacion, S.slots, S.source_hash)
+            .where(S.provincia.in_({k[0] for k in keys}), S.municipio.in_({k[1] for k in keys}))
+        )
+    }
+
+def _load_slot_indexes(keys):
+    """
+    slot_index ya creados de esos grupos (sólo los que cambian: el resto no se lee) y cuántos
+    están ocupados. -> ({clave: {slot_index}}, {clave: ocupadas})
+    """
+    O = FranquiciaOcupacion
+    occupied: Dict[GroupKey, Set[int]] = {}
+    busy: Dict[GroupKey, int] = {}
+    if not keys:
+        return occupied, busy
+    rows = db.session.execute(
+        db.select(O.provincia, O.municipio, O.nivel, O.distrito, O.slot_index, O.ocupado)
+        .where(O.provincia.in_({k[0] for k in keys}), O.municipio.in_({k[1] for k in keys}))
+    )
+    for r in rows:
+        key = (r[0], r[1], r[2], r[3])
+        if key in keys:
+            occupied.setdefault(key, set()).add(r[4])
+            if r[5]:
+                busy[key] = busy.get(key, 0) + 1
+    return occupied, busy
+
+def _executemany(stmt, rows: List[Dict[str, Any]]) -> None:
+    for i in range(0, len(rows), REBUILD_BATCH):
+        db.session.execute(stmt, rows[i:i + REBUILD_BATCH])
+
+def _bulk_upsert(model, inserts: List[Dict[str, Any]], conflict: Tuple[str, ...], update: Tuple[str, ...] = (),
+                 updates: List[Dict[str, Any]] = ()) -> None:
+    """
+    Escribe el diff por lotes: `inserts` (filas nuevas) y `updates` (filas existentes, se
+    reescriben las columnas `update` buscando por `conflict`).
+    SQLite/PostgreSQL: un único INSERT ... ON CONFLICT para ambas. Otros motores: INSERT de las
+    nuevas y UPDATE ... WHERE <conflict> de las existentes, ambos con executemany.
+    """
+    if not inserts and not updates:
+        return
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        ins = insert(table)
+        if update:
+            stmt = ins.on_conflict_do_update(index_elements=list(conflict), set_={c: ins.excluded[c] for c in update})
+        else:
+            stmt = ins.on_conflict_do_nothing(index_elements=list(conflict))
+        _executemany(stmt, list(inserts) + list(updates))
+        return
+    _executemany(table.insert(), list(inserts))
+    if updates:
+        # Parámetros con prefijo: bindparam no puede llamarse como una columna de la tabla
+        stmt = (table.update()
+                .where(*[table.c[c] == db.bindparam(f"k_{c}") for c in conflict])
+                .values({c: db.bindparam(f"v_{c}") for c in update}))
+        _executemany(stmt, [{**{f"k_{c}": r[c] for c in conflict}, **{f"v_{c}": r[c] for c in update}}
+                            for r in updates])
+
+def _diff_rows(municipios: List[Dict[str, Any]], idx_d, full: bool = False, empty: bool = False,
+               overlay: Optional[Dict[GroupKey, Tuple[int, int, str, int]]] = None) -> Dict[str, Any]:
+    """
+    Diff de un bloque de municipios contra la BD (sin escribir). Sólo los grupos cuyo hash de
+    origen cambió (o nuevos) se comparan con sus ocupaciones; `full` ignora los hashes y revisa
+    todos. `empty` = BD vacía (preserve=false). `overlay` = grupos ya planificados en bloques
+    anteriores de un dry-run, {clave: (poblacion, slots, hash, slot_index máximo)}.
+    """
+    wanted, max_index = _plan_groups(municipios, idx_d)
+    existing = {} if empty or not wanted else _load_groups(wanted.keys())
+    planned_max: Dict[GroupKey, int] = {}
+    if overlay:
+        for key in wanted.keys() & overlay.keys():
+            pob, slots, h, n = overlay[key]
+            existing[key] = (pob, slots, h)
+            planned_max[key] = n
+
+    inserts, updates = [], []
+    changed: Dict[GroupKey, None] = {}  # en orden del CSV (mismo orden de ids que fila a fila)
+    unchanged = 0
+    for key, (poblacion, slots, h) in wanted.items():
+        old = existing.get(key)
+        if old is not None and old[2] == h and not full:
+            unchanged += 1
+            continue
+        changed[key] = None
+        row = {"provincia": key[0], "municipio": key[1], "nivel": key[2], "distrito": key[3],
+               "poblacion": poblacion, "slots": slots, "source_hash": h,
+               "provincia_norm": search_norm(key[0]), "nombre_norm": _nombre_norm(key[1], key[3])}
+        if old is None:
+            inserts.append(row)
         else:
-            slots = _rule_slots_municipio(poblacion if poblacion >= 0 else 0)
-            group = FranquiciaSlots.query.filter_by(provincia=provincia, municipio=municipio, nivel="municipio", distrito="").first()
-            if not group:
-                group = FranquiciaSlots(provincia=provincia, municipio=municipio, nivel="municipio", distrito="", poblacion=poblacion, slots=slots)
-                db.session.add(group)
-                total_groups += 1
-            else:
-                group.poblacion = poblacion
-                group.slots = slots
-            db.session.flush()
-
-            for i in range(1, slots+1):
-                occ = FranquiciaOcupacion.query.filter_by(provincia=provincia, municipio=municipio, nivel="municipio", distrito="", slot_index=i).first()
-                if not occ:
-                    occ = FranquiciaOcupacion(provincia=provincia, municipio=municipio, nivel="municipio", distrito="", slot_index=i, ocupado=0, ocupado_por=None)
-                    db.session.add(occ)
-                    created_slots += 1
+            updates.append((row, old))
+
+    occupied, busy = ({}, {}) if empty else _load_slot_indexes(changed.keys())
+    for row in inserts:
+        # Grupo nuevo con ocupaciones ya existentes (p. ej. borrado a mano): el contador nace cuadrado
+        row["ocupadas"] = busy.get((row["provincia"], row["municipio"], row["nivel"], row["distrito"]), 0)
+    for row, _ in updates:
+        row["ocupadas"] = 0  # no se actualiza: lo mantienen ocupar_slot / liberar_slot
+    occ_rows = []
+    for key in changed:
+        have = occupied.get(key, ())
+        start = planned_max.get(key, 0)
+        provincia, municipio, nivel, distrito = key
+        occ_rows.extend(
+            {"provincia": provincia, "municipio": municipio, "nivel": nivel, "distrito": distrito,
+             "slot_index": i, "ocupado": 0, "ocupado_por": None}
+            for i in range(start + 1, max_index[key] + 1) if i not in have
+        )
+    return {"wanted": wanted, "max_index": max_index, "inserts": inserts, "updates": updates,
+            "unchanged": unchanged, "occ_rows": occ_rows}
+
+def _apply_rows(municipios: List[Dict[str, Any]], idx_d, full: bool = False) -> Tuple[int, int, int]:
+    """Aplica el diff de un bloque de municipios (sin commit). -> (grupos nuevos, grupos tocados, slots creados)"""
+    diff = _diff_rows(municipios, idx_d, full=full)
+    changed = [row for row, old in diff["updates"] if old != (row["poblacion"], row["slots"], row["source_hash"])]
+    group_rows = diff["inserts"] + changed
+    _bulk_upsert(FranquiciaSlots, diff["inserts"], ("provincia", "municipio", "nivel", "distrito"),
+                 ("poblacion", "slots", "source_hash"), changed)
+    # Ocupaciones: sólo los slot_index que faltan (el diff ya excluye los existentes)
+    _bulk_upsert(FranquiciaOcupacion, diff["occ_rows"], ("provincia", "municipio", "nivel", "distrito", "slot_index"))
+    if group_rows or diff["occ_rows"]:
+        _bump_version()
+    return len(diff["inserts"]), len(group_rows), len(diff["occ_rows"])
+
+def _chunks(start_chunk: int, chunk_rows: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    rows = islice(_iter_csv(_municipios_csv()), start_chunk * chunk_rows, None)
+    n = start_chunk
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield n, chunk
+        n += 1
 
+def iter_rebuild_chunks(preserve_occupations: bool = True, chunk_rows: int = ETL_CHUNK_ROWS, start_chunk: int = 0,
+                        full: bool = False):
+    """
+    Recorre municipios_es.csv en bloques de `chunk_rows` filas y aplica cada uno. Tras cada bloque
+    cede (nº de bloque, filas, grupos nuevos, grupos tocados, slots creados) SIN commit: quien
+    consume confirma, junto con su checkpoint si lo tiene. `start_chunk` reanuda saltando bloques.
+    """
+    _municipios_csv()
+    idx_d = _district_index()
+    chunk_rows = max(1, int(chunk_rows))
+    if not preserve_occupations and start_chunk == 0:
+        # Se confirma con el primer bloque: si éste falla, no se pierde nada
+        FranquiciaOcupacion.query.delete()
+        FranquiciaSlots.query.delete()
+        _bump_version()
+
+    for n, chunk in _chunks(start_chunk, chunk_rows):
+        created, touched, slots = _apply_rows(chunk, idx_d, full=full)
+        yield n, len(chunk), created, touched, slots
+
+def rebuild_from_csv(preserve_occupations: bool = True, chunk_rows: int = ETL_CHUNK_ROWS, full: bool = False) -> Dict[str, Any]:
+    """
+    Reconstruye franquicia_slots/franquicia_ocupacion desde los CSV oficiales, en el proceso actual.
+    Incremental: sólo se escriben los grupos cuyo hash de origen cambió (`full=True` revisa todos,
+    p. ej. para recrear ocupaciones borradas a mano). Un commit por bloque; las ocupaciones
+    existentes no se tocan.
+    """
+    total_groups = 0
+    touched_groups = 0
+    created_slots = 0
+    for _, _, created, touched, slots in iter_rebuild_chunks(preserve_occupations, chunk_rows, full=full):
+        db.session.commit()
+        total_groups += created
+        touched_groups += touched
+        created_slots += slots
     db.session.commit()
-    return {"ok": True, "groups": total_groups, "created_slots": created_slots}
+    return {"ok": True, "groups": total_groups, "touched_groups": touched_groups, "created_slots": created_slots}
+
+def plan_rebuild(preserve_occupations: bool = True, full: bool = False, chunk_rows: int = ETL_CHUNK_ROWS,
+                 limit: int = 200) -> Dict[str, Any]:
+    """
+    Dry-run: lo que haría rebuild_from_csv, sin escribir. Devuelve los totales y hasta `limit`
+    altas y cambios (población y plazas antes/después). Las plazas que sobran al bajar `slots`
+    no se borran en el rebuild; se informan en `slots_delta`.
+    """
+    idx_d = _district_index()
+    overlay: Dict[GroupKey, Tuple[int, int, str, int]] = {}
+    inserts: List[Dict[str, Any]] = []
+    updates: List[Dict[str, Any]] = []
+    totals = {"rows": 0, "inserts": 0, "updates": 0, "rehashed": 0, "unchanged": 0, "created_slots": 0, "slots_delta": 0}
+
+    for _, chunk in _chunks(0, max(1, int(chunk_rows))):
+        diff = _diff_rows(chunk, idx_d, full=full, empty=not preserve_occupations, overlay=overlay)
+        totals["rows"] += len(chunk)
+        totals["unchanged"] += diff["unchanged"]
+        totals["created_slots"] += len(diff["occ_rows"])
+        for row in diff["inserts"]:
+            totals["inserts"] += 1
+            totals["slots_delta"] += row["slots"]
+            if len(inserts) < limit:
+                inserts.append({k: row[k] for k in ("provincia", "municipio", "nivel", "distrito", "poblacion", "slots")})
+        for row, (old_pob, old_slots, _) in diff["updates"]:
+            if (old_pob, old_slots) == (row["poblacion"], row["slots"]):
+                totals["rehashed"] += 1  # sólo cambia el hash (p. ej. filas anteriores a source_hash)
+                continue
+            totals["updates"] += 1
+            totals["slots_delta"] += row["slots"] - old_slots
+            if len(updates) < limit:
+                updates.append({"provincia": row["provincia"], "municipio": row["municipio"], "nivel": row["nivel"],
+                                "distrito": row["distrito"], "poblacion": [old_pob, row["poblacion"]],
+                                "slots": [old_slots, row["slots"]]})
+        for key, (pob, slots, h) in diff["wanted"].items():
+            prev = overlay.get(key)
+            overlay[key] = (pob, slots, h, max(diff["max_index"][key], prev[3] if prev else 0))
+        db.session.rollback()  # sólo lecturas: no retener la transacción entre bloques
+
+    return {"ok": True, "dry_run": True, **totals, "items": {"inserts": inserts, "updates": updates}}
+
+# ========= Rebuild en segundo plano =========
+# Un job "ejecutando" sin progreso en este tiempo se considera muerto (worker reiniciado)
+ETL_JOB_STALE_S = int(os.getenv("PLAZAS_ETL_JOB_STALE_S", "600"))
+
+def _job_dict(job: FranquiciaEtlJob) -> Dict[str, Any]:
+    estado = job.estado
+    if estado == "ejecutando" and time.time() - (job.updated_at or 0) > ETL_JOB_STALE_S:
+        estado = "interrumpido"
+    return {
+        "job_id": job.id, "estado": estado, "preserve": bool(job.preserve), "full_scan": bool(job.full_scan), "chunk_rows": job.chunk_rows,
+        "next_chunk": job.next_chunk, "rows": job.rows, "groups_created": job.groups_created,
+        "groups_touched": job.groups_touched, "created_slots": job.created_slots,
+        "elapsed_s": round(job.elapsed_s or 0.0, 2), "error": job.error,
+    }
+
+def get_rebuild_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = db.session.get(FranquiciaEtlJob, job_id)
+    return _job_dict(job) if job else None
+
+# Un rebuild a la vez entre workers: el cerrojo es una fila de la BD. El UPDATE sólo mira la
+# propia fila (libre o con latido caducado), así dos peticiones a la vez no pueden ganar ambas.
+def _claim_lock(job_id: str) -> bool:
+    """Reclama el cerrojo para `job_id` dentro de la transacción en curso (se confirma con el job)."""
+    L = FranquiciaEtlLock
+    now = time.time()
+    free = db.or_(L.job_id.is_(None), L.job_id == job_id, L.heartbeat < now - ETL_JOB_STALE_S)
+    if L.query.filter(L.id == 1, free).update({"job_id": job_id, "heartbeat": now}, synchronize_session=False):
+        return True
+    if db.session.get(L, 1) is not None:
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.add(L(id=1, job_id=job_id, heartbeat=now))
+        return True
+    except IntegrityError:
+        return False  # otro worker creó la fila (y el cerrojo) a la vez
+
+def _renew_lock(job_id: str) -> None:
+    """Latido del job dueño; si otro lo ha reclamado (éste se dio por caído), se aborta."""
+    L = FranquiciaEtlLock
+    if not L.query.filter_by(id=1, job_id=job_id).update({"heartbeat": time.time()}, synchronize_session=False):
+        raise RuntimeError("cerrojo de rebuild perdido")
+
+def _release_lock(job_id: str) -> None:
+    FranquiciaEtlLock.query.filter_by(id=1, job_id=job_id).update(
+        {"job_id": None, "heartbeat": None}, synchronize_session=False)
+
+def _lock_holder() -> Optional[FranquiciaEtlJob]:
+    lock = db.session.get(FranquiciaEtlLock, 1)
+    return db.session.get(FranquiciaEtlJob, lock.job_id) if lock and lock.job_id else None
+
+def run_rebuild_job(job_id: str) -> None:
+    """Ejecuta (o reanuda desde `next_chunk`) un job; cada bloque se confirma junto con su checkpoint."""
+    job = db.session.get(FranquiciaEtlJob, job_id)
+    job.estado = "ejecutando"
+    job.error = None
+    job.updated_at = time.time()
+    _renew_lock(job_id)
+    db.session.commit()
+    t0 = time.monotonic()
+    base_elapsed = job.elapsed_s or 0.0
+    try:
+        chunks = iter_rebuild_chunks(bool(job.preserve), job.chunk_rows, job.next_chunk, full=bool(job.full_scan))
+        for n, rows, created, touched, slots in chunks:
+            job.next_chunk = n + 1
+            job.rows += rows
+            job.groups_created += created
+            job.groups_touched += touched
+            job.created_slots += slots
+            job.elapsed_s = base_elapsed + time.monotonic() - t0
+            job.updated_at = time.time()
+            _renew_lock(job_id)
+            db.session.commit()
+        job.estado = "completado"
+        job.finished_at = job.updated_at = time.time()
+        job.elapsed_s = base_elapsed + time.monotonic() - t0
+        _release_lock(job_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(FranquiciaEtlJob, job_id)
+        job.estado = "error"
+        job.error = str(e)[:1000]
+        job.elapsed_s = base_elapsed + time.monotonic() - t0
+        job.updated_at = time.time()
+        _release_lock(job_id)
+        db.session.commit()
+    finally:
+        db.session.remove()
+
+def _spawn(app, job_id: str) -> None:
+    def target():
+        with app.app_context():
+            run_rebuild_job(job_id)
+    threading.Thread(target=target, name=f"etl-rebuild-{job_id[:8]}", daemon=True).start()
+
+def start_rebuild_job(app, preserve_occupations: bool = True, chunk_rows: int = ETL_CHUNK_ROWS,
+                      full: bool = False) -> Dict[str, Any]:
+    """Crea el job y lo lanza en un hilo con contexto de `app`; la petición HTTP vuelve enseguida."""
+    _municipios_csv()
+    job_id = str(uuid.uuid4())
+    if not _claim_lock(job_id):
+        db.session.rollback()
+        running = _lock_holder()
+        return {"ok": False, "error": "rebuild_en_curso", "job": _job_dict(running) if running else None}
+    job = FranquiciaEtlJob(id=job_id, estado="en_cola", preserve=int(bool(preserve_occupations)),
+                           full_scan=int(bool(full)), chunk_rows=max(1, int(chunk_rows)), updated_at=time.time())
+    db.session.add(job)
+    db.session.commit()
+    _spawn(app, job.id)
+    return {"ok": True, "job": _job_dict(job)}
+
+def resume_rebuild_job(app, job_id: str) -> Dict[str, Any]:
+    """Reanuda un job fallido o interrumpido desde el primer bloque sin confirmar."""
+    job = db.session.get(FranquiciaEtlJob, job_id)
+    if not job:
+        return {"ok": False, "error": "job_no_existe"}
+    estado = _job_dict(job)["estado"]
+    if estado not in ("error", "interrumpido"):
+        return {"ok": False, "error": f"job_{estado}", "job": _job_dict(job)}
+    if not _claim_lock(job.id):
+        db.session.rollback()
+        running = _lock_holder()
+        return {"ok": False, "error": "rebuild_en_curso", "job": _job_dict(running) if running else None}
+    job.estado = "en_cola"
+    job.updated_at = time.time()
+    db.session.commit()
+    _spawn(app, job.id)
+    return {"ok": True, "job": _job_dict(job)}
+
+# ========= Búsqueda =========
+# Columnas normalizadas (minúsculas, sin tildes, sin artículo inicial) en franquicia_slots:
+# "Málaga" = "malaga"; "A Coruña" = "La Coruña" = "Coruña, A" (INE) = "coruna".
+# - prefijo: rango sobre el índice B-tree de nombre_norm
+# - subcadena: FTS5 con tokenizer trigram en SQLite, índice GIN pg_trgm en PostgreSQL
+# El esquema (índices, backfill) lo prepara setup_search() desde migrate_add_franquicia_columns.py
+# o `flask franquicia setup-search`; las lecturas sólo comprueban search_ready() y, si aún no
+# está, buscan con ilike sobre los nombres originales, como antes.
+AUTOCOMPLETE_MAX = int(os.getenv("FRANQ_AUTOCOMPLETE_MAX", "20"))
+SEARCH_RECHECK_S = float(os.getenv("FRANQ_SEARCH_RECHECK_S", "60"))
+_ARTICLES = frozenset(("el", "la", "los", "las", "l", "a", "o", "os", "as", "es", "sa", "ses", "s"))
+_NON_ALNUM = re.compile(r"[^a-z0-9,]+")
+_search_state: Dict[str, Tuple[bool, float]] = {}  # URL de BD -> (preparada, instante de la comprobación)
+
+def search_norm(text: Optional[str]) -> str:
+    t = unicodedata.normalize("NFKD", text or "")
+    t = _NON_ALNUM.sub(" ", "".join(c for c in t if not unicodedata.combining(c)).lower())
+    name, comma, tail = t.rpartition(",")
+    if comma and tail.strip() in _ARTICLES:
+        t = name  # "Coruña, A" -> "Coruña"
+    words = t.replace(",", " ").split()
+    if len(words) > 1 and words[0] in _ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+def _nombre_norm(municipio: str, distrito: str) -> str:
+    return f"{search_norm(municipio)} {search_norm(distrito)}".strip() if distrito else search_norm(municipio)
+
+_SQLITE_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS franquicia_slots_fts USING fts5(
+         nombre_norm, content='franquicia_slots', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS franquicia_slots_fts_ai AFTER INSERT ON franquicia_slots BEGIN
+         INSERT INTO franquicia_slots_fts(rowid, nombre_norm) VALUES (new.id, new.nombre_norm);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS franquicia_slots_fts_ad AFTER DELETE ON franquicia_slots BEGIN
+         INSERT INTO franquicia_slots_fts(franquicia_slots_fts, rowid, nombre_norm) VALUES ('delete', old.id, old.nombre_norm);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS franquicia_slots_fts_au AFTER UPDATE OF nombre_norm ON franquicia_slots BEGIN
+         INSERT INTO franquicia_slots_fts(franquicia_slots_fts, rowid, nombre_norm) VALUES ('delete', old.id, old.nombre_norm);
+         INSERT INTO franquicia_slots_fts(rowid, nombre_norm) VALUES (new.id, new.nombre_norm);
+       END""",
+)
+_POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_franquicia_slots_nombre_trgm ON franquicia_slots USING gin (nombre_norm gin_trgm_ops)",
+)
+
+def setup_search(conn) -> Dict[str, Any]:
+    """
+    Rellena las columnas normalizadas que falten y crea FTS5/trigram (idempotente). Es DDL:
+    se ejecuta desde la migración o el CLI, con una conexión en transacción (engine.begin()).
+    """
+    S = FranquiciaSlots.__table__
+    missing = conn.execute(
+        db.select(S.c.id, S.c.provincia, S.c.municipio, S.c.distrito).where(S.c.nombre_norm.is_(None))
+    ).all()
+    if missing:
+        conn.execute(
+            S.update().where(S.c.id == db.bindparam("b_id"))
+            .values(provincia_norm=db.bindparam("b_prov"), nombre_norm=db.bindparam("b_nombre")),
+            [{"b_id": r[0], "b_prov": search_norm(r[1]), "b_nombre": _nombre_norm(r[2], r[3])} for r in missing],
+        )
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        created = not conn.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'franquicia_slots_fts'")).first()
+        for ddl in _SQLITE_SEARCH_DDL:
+            conn.execute(db.text(ddl))
+        if created or missing:
+            conn.execute(db.text("INSERT INTO franquicia_slots_fts(franquicia_slots_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        for ddl in _POSTGRES_SEARCH_DDL:
+            conn.execute(db.text(ddl))
+    _search_state.pop(str(conn.engine.url), None)
+    return {"dialect": dialect, "backfilled": len(missing)}
+
+def search_ready() -> bool:
+    """
+    True si el índice de subcadenas existe y no quedan filas sin normalizar. Sólo lee; el sí
+    se recuerda por proceso y el no se vuelve a comprobar cada SEARCH_RECHECK_S segundos.
+    """
+    bind = db.session.get_bind()
+    key = str(bind.url)
+    ready, checked = _search_state.get(key, (False, 0.0))
+    if ready or time.monotonic() - checked < SEARCH_RECHECK_S:
+        return ready
+    if bind.dialect.name == "sqlite":
+        index = "SELECT 1 FROM sqlite_master WHERE name = 'franquicia_slots_fts'"
+    elif bind.dialect.name == "postgresql":
+        index = "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_franquicia_slots_nombre_trgm'"
+    else:
+        index = "SELECT 1"  # sin índice de subcadenas: LIKE sobre nombre_norm
+    ready = bool(db.session.execute(db.text(index)).first()) and not db.session.execute(
+        db.select(FranquiciaSlots.id).where(FranquiciaSlots.nombre_norm.is_(None)).limit(1)).first()
+    _search_state[key] = (ready, time.monotonic())
+    return ready
+
+def _legacy_name_filter(q: str):
+    """Búsqueda sin el esquema de search: ilike sobre municipio/distrito (sin índice)."""
+    like = f"%{q.strip()}%"
+    return db.or_(FranquiciaSlots.municipio.ilike(like), FranquiciaSlots.distrito.ilike(like))
+
+def _provincia_filter(provincia: str, ready: bool):
+    if ready:
+        return FranquiciaSlots.provincia_norm.like(f"%{search_norm(provincia)}%")
+    return FranquiciaSlots.provincia.ilike(f"%{provincia}%")
+
+def _substring_filter(qn: str):
+    """Condición "nombre_norm contiene qn" que usa el índice de subcadenas del motor."""
+    S = FranquiciaSlots
+    if len(qn) >= 3 and db.session.get_bind().dialect.name == "sqlite":
+        match = '"' + qn.replace('"', '""') + '"'
+        return S.id.in_(db.text("SELECT rowid FROM franquicia_slots_fts WHERE franquicia_slots_fts MATCH :m")
+                        .bindparams(m=match))
+    return S.nombre_norm.like(f"%{qn}%")
+
+def _prefix_filter(qn: str):
+    S = FranquiciaSlots
+    if db.session.get_bind().dialect.name == "sqlite":
+        return db.and_(S.nombre_norm >= qn, S.nombre_norm < qn + "~")  # rango: usa el índice B-tree
+    return S.nombre_norm.like(f"{qn}%")
+
+def autocomplete(q: str, limit: int = 10, provincia: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Top-N grupos cuyo nombre casa con `q`. Orden: nombre exacto, empieza por q, alguna palabra
+    empieza por q, contiene q; a igualdad, más población primero.
+    """
+    qn = search_norm(q)
+    if not qn:
+        return []
+    ready = search_ready()
+    S = FranquiciaSlots
+    limit = max(1, min(AUTOCOMPLETE_MAX, int(limit)))
+    cols = (S.id, S.provincia, S.municipio, S.nivel, S.distrito, S.poblacion, S.slots, S.ocupadas, S.nombre_norm)
+    extra = [_provincia_filter(provincia, ready)] if provincia else []
+    pool = 10 * limit  # candidatos por vía antes de ordenar
+
+    found = {}
+    if ready:
+        found = {r.id: r for r in db.session.execute(
+            db.select(*cols).where(_prefix_filter(qn), *extra).order_by(S.poblacion.desc()).limit(pool))}
+    if len(found) < limit or len(qn) >= 3:
+        name_filter = _substring_filter(qn) if ready else _legacy_name_filter(q)
+        for r in db.session.execute(
+                db.select(*cols).where(name_filter, *extra).order_by(S.poblacion.desc()).limit(pool)):
+            found.setdefault(r.id, r)
+
+    def rank(r):
+        name = r.nombre_norm or _nombre_norm(r.municipio, r.distrito)
+        if name == qn:
+            score = 0
+        elif name.startswith(qn):
+            score = 1
+        elif f" {qn}" in f" {name}":
+            score = 2
+        else:
+            score = 3
+        return score, -(r.poblacion or 0), name
+
+    out = []
+    for r in sorted(found.values(), key=rank)[:limit]:
+        label = f"{r.municipio} · {r.distrito}" if r.distrito else r.municipio
+        out.append({"id": r.id, "label": f"{label} ({r.provincia})", "provincia": r.provincia,
+                    "municipio": r.municipio, "nivel": r.nivel, "distrito": r.distrito,
+                    "poblacion": int(r.poblacion or 0), "libres": int(r.slots or 0) - int(r.ocupadas or 0),
+                    "score": rank(r)[0]})
+    return out
 
 def summary_totals() -> Dict[str, int]:
-    total_plazas = db.session.query(db.func.coalesce(db.func.sum(FranquiciaSlots.slots), 0)).scalar()
-    total_ocupadas = db.session.query(db.func.coalesce(db.func.sum(FranquiciaOcupacion.ocupado), 0)).scalar()
+    # Contador materializado en franquicia_slots: no se agrega franquicia_ocupacion
+    total_plazas, total_ocupadas = db.session.query(
+        db.func.coalesce(db.func.sum(FranquiciaSlots.slots), 0),
+        db.func.coalesce(db.func.sum(FranquiciaSlots.ocupadas), 0),
+    ).one()
     libres = int(total_plazas or 0) - int(total_ocupadas or 0)
     return {"total_plazas": int(total_plazas or 0), "ocupadas": int(total_ocupadas or 0), "libres": libres}
 
-def query_slots(provincia: Optional[str]=None, estado: str="todas", q: Optional[str]=None):
-    occ_counts = db.session.query(
-        FranquiciaOcupacion.provincia.label("prov"),
-        FranquiciaOcupacion.municipio.label("mun"),
-        FranquiciaOcupacion.nivel.label("niv"),
-        FranquiciaOcupacion.distrito.label("dis"),
-        db.func.sum(FranquiciaOcupacion.ocupado).label("ocupadas")
-    ).group_by("prov","mun","niv","dis").subquery()
-
-    qry = db.session.query(
-        FranquiciaSlots.id,
-        FranquiciaSlots.provincia,
-        FranquiciaSlots.municipio,
-        FranquiciaSlots.nivel,
-        FranquiciaSlots.distrito,
-        FranquiciaSlots.poblacion,
-        FranquiciaSlots.slots,
-        db.func.coalesce(occ_counts.c.ocupadas, 0).label("ocupadas")
-    ).outerjoin(
-        occ_counts,
-        db.and_(
-            FranquiciaSlots.provincia == occ_counts.c.prov,
-            FranquiciaSlots.municipio == occ_counts.c.mun,
-            FranquiciaSlots.nivel == occ_counts.c.niv,
-            FranquiciaSlots.distrito == occ_counts.c.dis,
-        )
-    )
+SLOTS_PAGE_DEFAULT = int(os.getenv("FRANQ_SLOTS_PAGE", "100"))
+SLOTS_PAGE_MAX = int(os.getenv("FRANQ_SLOTS_PAGE_MAX", "500"))
 
+def _encode_cursor(r) -> str:
+    raw = json.dumps([r.provincia, r.municipio, r.distrito, r.id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str, str, int]:
+    """ValueError si el cursor no es uno emitido por _encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        provincia, municipio, distrito, id_ = json.loads(raw)
+        return str(provincia), str(municipio), str(distrito), int(id_)
+    except Exception:
+        raise ValueError("cursor no válido")
+
+def query_slots(provincia: Optional[str]=None, estado: str="todas", q: Optional[str]=None,
+                limit: int = SLOTS_PAGE_DEFAULT, after: Optional[str] = None, with_total: bool = False):
+    """
+    Página de grupos ordenada por (provincia, municipio, distrito, id) con paginación por cursor:
+    `after` = `next` de la página anterior. El filtro de estado va en SQL (contador `ocupadas`)
+    y el total sólo se cuenta si se pide (`with_total`).
+    """
+    S = FranquiciaSlots
+    limit = max(1, min(SLOTS_PAGE_MAX, int(limit)))
+    qry = db.session.query(S.id, S.provincia, S.municipio, S.nivel, S.distrito, S.poblacion, S.slots, S.ocupadas)
+
+    ready = search_ready() if (provincia or q) else False
     if provincia:
-        qry = qry.filter(FranquiciaSlots.provincia.ilike(f"%{provincia}%"))
-    if q:
-        like = f"%{q}%"
-        qry = qry.filter(db.or_(
-            FranquiciaSlots.municipio.ilike(like),
-            FranquiciaSlots.distrito.ilike(like)
-        ))
-
-    rows = []
-    for r in qry.all():
+        qry = qry.filter(_provincia_filter(provincia, ready))
+    if q and search_norm(q):
+        qry = qry.filter(_substring_filter(search_norm(q)) if ready else _legacy_name_filter(q))
+    if estado == "ocupadas":
+        qry = qry.filter(S.ocupadas > 0)
+    elif estado == "libres":
+        qry = qry.filter(S.slots > S.ocupadas)
+
+    total = qry.order_by(None).count() if with_total else None
+    if after:
+        qry = qry.filter(db.tuple_(S.provincia, S.municipio, S.distrito, S.id) > db.tuple_(*_decode_cursor(after)))
+    page = qry.order_by(S.provincia, S.municipio, S.distrito, S.id).limit(limit + 1).all()
+
+    items = []
+    for r in page[:limit]:
         ocupadas = int(r.ocupadas or 0)
-        libres = int(r.slots or 0) - ocupadas
-        if estado == "ocupadas" and ocupadas <= 0:
-            continue
-        if estado == "libres" and libres <= 0:
-            continue
-        rows.append({
+        items.append({
             "id": r.id,
             "provincia": r.provincia,
             "municipio": r.municipio,
@@ -161,9 +693,12 @@ def query_slots(provincia: Optional[str]=None, estado: str="todas", q: Optional[
             "poblacion": int(r.poblacion or 0),
             "slots": int(r.slots or 0),
             "ocupadas": ocupadas,
-            "libres": libres,
+            "libres": int(r.slots or 0) - ocupadas,
         })
-    return rows
+    out = {"items": items, "limit": limit, "next": _encode_cursor(page[limit - 1]) if len(page) > limit else None}
+    if with_total:
+        out["total"] = total
+    return out
 
 def get_group_occupancy(slot_group_id: int):
     g = FranquiciaSlots.query.get(slot_group_id)
@@ -177,28 +712,60 @@ def get_group_occupancy(slot_group_id: int):
         for o in occs
     ]
 
-def ocupar_slot(provincia: str, municipio: str, nivel: str, distrito: str, slot_index: int, ocupado_por: str):
-    o = FranquiciaOcupacion.query.filter_by(
-        provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito, slot_index=slot_index
-    ).first()
-    if not o:
-        return {"ok": False, "error": "slot_no_existe"}
-    if int(o.ocupado or 0) == 1:
-        return {"ok": False, "error": "ya_ocupado"}
-    o.ocupado = 1
-    o.ocupado_por = ocupado_por
+def _set_ocupado(provincia: str, municipio: str, nivel: str, distrito: str, slot_index: int,
+                 ocupado: int, ocupado_por: Optional[str]) -> Optional[str]:
+    """
+    Cambia el estado de un slot y ajusta franquicia_slots.ocupadas en la misma transacción.
+    El UPDATE es condicional (sólo si el estado cambia): dos peticiones a la vez no cuentan doble.
+    Devuelve el código de error o None.
+    """
+    key = dict(provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito)
+    changed = FranquiciaOcupacion.query.filter_by(**key, slot_index=slot_index, ocupado=1 - ocupado).update(
+        {"ocupado": ocupado, "ocupado_por": ocupado_por}, synchronize_session=False
+    )
+    if not changed:
+        db.session.rollback()
+        if not FranquiciaOcupacion.query.filter_by(**key, slot_index=slot_index).first():
+            return "slot_no_existe"
+        return "ya_ocupado" if ocupado else "ya_libre"
+    FranquiciaSlots.query.filter_by(**key).update(
+        {"ocupadas": FranquiciaSlots.ocupadas + (1 if ocupado else -1)}, synchronize_session=False
+    )
+    _bump_version()
     db.session.commit()
-    return {"ok": True}
+    return None
+
+def ocupar_slot(provincia: str, municipio: str, nivel: str, distrito: str, slot_index: int, ocupado_por: str):
+    error = _set_ocupado(provincia, municipio, nivel, distrito, slot_index, 1, ocupado_por)
+    return {"ok": False, "error": error} if error else {"ok": True}
 
 def liberar_slot(provincia: str, municipio: str, nivel: str, distrito: str, slot_index: int):
-    o = FranquiciaOcupacion.query.filter_by(
-        provincia=provincia, municipio=municipio, nivel=nivel, distrito=distrito, slot_index=slot_index
-    ).first()
-    if not o:
-        return {"ok": False, "error": "slot_no_existe"}
-    if int(o.ocupado or 0) == 0:
-        return {"ok": False, "error": "ya_libre"}
-    o.ocupado = 0
-    o.ocupado_por = None
-    db.session.commit()
-    return {"ok": True}
+    error = _set_ocupado(provincia, municipio, nivel, distrito, slot_index, 0, None)
+    return {"ok": False, "error": error} if error else {"ok": True}
+
+# ========= Contador ocupadas =========
+def check_ocupadas(repair: bool = False, limit: int = 200) -> Dict[str, Any]:
+    """
+    Compara franquicia_slots.ocupadas con la suma real de franquicia_ocupacion por grupo.
+    Con `repair` corrige los descuadres (una sola transacción). Devuelve hasta `limit` ejemplos.
+    """
+    S, O = FranquiciaSlots, FranquiciaOcupacion
+    real = db.session.query(
+        O.provincia.label("prov"), O.municipio.label("mun"), O.nivel.label("niv"), O.distrito.label("dis"),
+        db.func.sum(O.ocupado).label("ocupadas"),
+    ).group_by(O.provincia, O.municipio, O.nivel, O.distrito).subquery()
+    real_ocupadas = db.func.coalesce(real.c.ocupadas, 0)
+    rows = db.session.query(S.id, S.provincia, S.municipio, S.nivel, S.distrito, S.ocupadas, real_ocupadas).outerjoin(
+        real, db.and_(S.provincia == real.c.prov, S.municipio == real.c.mun,
+                      S.nivel == real.c.niv, S.distrito == real.c.dis)
+    ).filter(S.ocupadas != real_ocupadas).all()
+
+    if repair and rows:
+        db.session.execute(db.update(S), [{"id": r[0], "ocupadas": int(r[6])} for r in rows])
+        _bump_version()
+        db.session.commit()
+    return {
+        "ok": True, "descuadres": len(rows), "reparado": bool(repair and rows),
+        "items": [{"id": r[0], "provincia": r[1], "municipio": r[2], "nivel": r[3], "distrito": r[4],
+                   "ocupadas": int(r[5] or 0), "real": int(r[6])} for r in rows[:limit]],
+    }
@@ -0,0 +1,193 @@
+# voice_admission.py — control de admisión de llamadas
+# Cuenta las llamadas puenteadas (y las admitidas que aún no han abierto el stream) y,
+# por encima del límite, el webhook responde con TwiML de desborde en vez de abrir otro stream.
+# CallAdmission cuenta por proceso: vale para el gateway (el stream vive en el worker que lo
+# abre), pero con varios workers el límite efectivo es límite × workers. SQLiteCallAdmission
+# guarda las plazas en un fichero SQLite compartido: la admite un worker y la libera otro.
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from voice_twiml import xml_escape
+
+HUMAN_FALLBACK_NUMBER = os.getenv("HUMAN_FALLBACK_NUMBER", "+34616232306")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "data", "voice_admission.db")
+
+class CallAdmission:
+    """
+    max_calls <= 0 desactiva el límite.
+    Una llamada admitida que no conecta en `pending_ttl_s` se libera sola; una conectada que
+    nunca se libera (worker distinto, callback perdido) caduca a los `active_ttl_s`.
+    """
+
+    def __init__(self, max_calls: int, pending_ttl_s: float = 30.0, active_ttl_s: float = 4 * 3600):
+        self.max_calls = int(max_calls)
+        self.pending_ttl_s = pending_ttl_s
+        self.active_ttl_s = active_ttl_s
+        self._calls: Dict[str, Tuple[float, bool]] = {}  # call_sid -> (instante, conectada)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _expire(self, now: float) -> None:
+        stale = [sid for sid, (ts, connected) in self._calls.items()
+                 if now - ts > (self.active_ttl_s if connected else self.pending_ttl_s)]
+        for sid in stale:
+            del self._calls[sid]
+
+    @property
+    def active(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._calls)
+
+    def try_admit(self, call_sid: str = "") -> bool:
+        """Reserva plaza para la llamada. False = desborde."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if call_sid and call_sid in self._calls:
+                return True  # reintento del mismo webhook
+            if self.max_calls > 0 and len(self._calls) >= self.max_calls:
+                self.rejected += 1
+                return False
+            self._calls[call_sid or f"anon-{uuid.uuid4().hex}"] = (now, False)
+            self.admitted += 1
+            return True
+
+    def connected(self, call_sid: str) -> None:
+        """El stream de la llamada está puenteado (se registra aunque la admitiera otro worker)."""
+        if call_sid:
+            with self._lock:
+                self._calls[call_sid] = (time.monotonic(), True)
+
+    def release(self, call_sid: str) -> None:
+        if call_sid:
+            with self._lock:
+                self._calls.pop(call_sid, None)
+
+    def stats(self) -> dict:
+        return {"active": self.active, "max": self.max_calls, "admitted": self.admitted, "rejected": self.rejected}
+
+class SQLiteCallAdmission:
+    """
+    Misma interfaz que CallAdmission con las plazas en SQLite (WAL), compartidas entre workers
+    de gunicorn. La comprobación del límite y la reserva van en una transacción BEGIN IMMEDIATE,
+    así dos workers no pueden ocupar a la vez la última plaza.
+    `admitted`/`rejected` siguen siendo contadores del proceso.
+    """
+
+    def __init__(self, max_calls: int, path: str = DEFAULT_DB_PATH,
+                 pending_ttl_s: float = 30.0, active_ttl_s: float = 4 * 3600):
+        self.max_calls = int(max_calls)
+        self.path = path
+        self.pending_ttl_s = pending_ttl_s
+        self.active_ttl_s = active_ttl_s
+        self._local = threading.local()
+        self.admitted = 0
+        self.rejected = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().execute(
+            """
+            CREATE TABLE IF NOT EXISTS voice_admission (
+              call_sid TEXT PRIMARY KEY,
+              ts REAL NOT NULL,            -- epoch (s) de la reserva o de la conexión
+              connected INTEGER NOT NULL   -- 0 = admitida sin conectar, 1 = puenteada
+            )
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Una conexión por hilo en autocommit; las transacciones se abren a mano."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(
+            "DELETE FROM voice_admission WHERE ts < CASE connected WHEN 1 THEN ? ELSE ? END",
+            (now - self.active_ttl_s, now - self.pending_ttl_s),
+        )
+
+    @property
+    def active(self) -> int:
+        conn = self._conn()
+        now = time.time()
+        return conn.execute(
+            "SELECT COUNT(*) FROM voice_admission WHERE ts >= CASE connected WHEN 1 THEN ? ELSE ? END",
+            (now - self.active_ttl_s, now - self.pending_ttl_s),
+        ).fetchone()[0]
+
+    def try_admit(self, call_sid: str = "") -> bool:
+        """Reserva plaza para la llamada. False = desborde."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire(conn, now)
+            if call_sid and conn.execute("SELECT 1 FROM voice_admission WHERE call_sid = ?", (call_sid,)).fetchone():
+                conn.execute("COMMIT")
+                return True  # reintento del mismo webhook
+            if self.max_calls > 0 and conn.execute("SELECT COUNT(*) FROM voice_admission").fetchone()[0] >= self.max_calls:
+                conn.execute("COMMIT")
+                self.rejected += 1
+                return False
+            conn.execute("INSERT INTO voice_admission (call_sid, ts, connected) VALUES (?, ?, 0)",
+                         (call_sid or f"anon-{uuid.uuid4().hex}", now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.admitted += 1
+        return True
+
+    def connected(self, call_sid: str) -> None:
+        if call_sid:
+            self._conn().execute(
+                """
+                INSERT INTO voice_admission (call_sid, ts, connected) VALUES (?, ?, 1)
+                ON CONFLICT(call_sid) DO UPDATE SET ts = excluded.ts, connected = 1
+                """,
+                (call_sid, time.time()),
+            )
+
+    def release(self, call_sid: str) -> None:
+        if call_sid:
+            self._conn().execute("DELETE FROM voice_admission WHERE call_sid = ?", (call_sid,))
+
+    def stats(self) -> dict:
+        return {"active": self.active, "max": self.max_calls, "admitted": self.admitted, "rejected": self.rejected}
+
+@lru_cache(maxsize=16)
+def overflow_twiml(action: str = "dial", retry_url: str = "", hold_s: int = 15,
+                   number: str = HUMAN_FALLBACK_NUMBER) -> str:
+    """
+    TwiML de desborde:
+      dial -> pasa la llamada a `number` (agente humano)
+      hold -> mensaje de espera y vuelve a `retry_url` (que reintenta la admisión)
+    Se cachea por argumentos: con el worker saturado se sirve en cada llamada rechazada.
+    """
+    if action == "hold" and retry_url:
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Say language="es-ES">Todas nuestras líneas están ocupadas. Por favor, espera un momento.</Say>
+  <Pause length="{int(hold_s)}"/>
+  <Redirect method="POST">{xml_escape(retry_url)}</Redirect>
+</Response>"""
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Say language="es-ES">En este momento todas nuestras líneas están ocupadas. Te pasamos con un agente.</Say>
+  <Dial callerId="{xml_escape(number)}">
+    <Number>{xml_escape(number)}</Number>
+  </Dial>
+</Response>"""
@@ -2,6 +2,9 @@
 # voice_bot.py — SpainRoom Voice Bot ES/EN (Twilio)
 import os
 from flask import Blueprint, request, Response
+from voice_twiml import CONTENT_TYPE, TwimlTemplate
+from voice_intents import analyze
+from voice_sessions import make_session_store
 from email.message import EmailMessage
 import smtplib
 
@@ -12,138 +15,198 @@ HUMAN_FALLBACK_NUMBER = os.getenv("HUMAN_FALLBACK_NUMBER", "+34616232306")
 VOICE_ES = "Polly-Conchita"
 VOICE_EN = "Polly-Joanna"
 
+# lang -> (locale de <Say>/<Gather>, voz)
+LOCALES = {"es": ("es-ES", VOICE_ES), "en": ("en-US", VOICE_EN)}
+MENU_INTENTS = ("reservas", "propietarios", "franquiciados", "oportunidades")
 
-def twiml(xml: str) -> Response:
-    return Response(xml, content_type="text/xml; charset=utf-8")
+# Estado por CallSid entre webhooks (VOICE_SESSION_BACKEND=memory|sqlite, ver voice_sessions)
+SESSIONS = make_session_store()
+# Turnos seguidos sin entender al llamante antes de pasarle con un agente
+MAX_RETRIES = int(os.getenv("VOICE_MAX_RETRIES", "2"))
+
+
+def twiml(xml) -> Response:
+    return Response(xml, content_type=CONTENT_TYPE)
 
 
 def detect_language(text: str) -> str:
-    t = (text or "").lower()
-    if any(k in t for k in ["hello", "reservation", "booking", "deposit", "owner", "franchise", "opportunity"]):
-        return "en"
-    if any(k in t for k in ["hola", "reserva", "reservar", "señal", "propietario", "franquicia", "oportunidad"]):
-        return "es"
-    return "es"
+    return analyze(text).lang
 
 
 def detect_intent(text: str, lang: str) -> str:
-    t = (text or "").lower()
-    if lang == "en":
-        if "reservation" in t or "booking" in t: return "reservas"
-        if "landlord" in t or "owner" in t: return "propietarios"
-        if "franchise" in t: return "franquiciados"
-        if "opportunit" in t or "partner" in t: return "oportunidades"
-        if "person" in t or "agent" in t: return "human"
-    else:
-        if "reserva" in t or "señal" in t: return "reservas"
-        if "propietario" in t or "dueño" in t: return "propietarios"
-        if "franquici" in t: return "franquiciados"
-        if "oportunidad" in t or "colaborador" in t: return "oportunidades"
-        if "persona" in t or "agente" in t: return "human"
-    return "unknown"
+    return analyze(text, lang).intent
+
+
+MESSAGES_ES = {
+    "welcome": "Bienvenido a SpainRoom. Puedes hablar en español o en inglés. ¿En qué puedo ayudarte?",
+    "noinput": "No recibí respuesta.",
+    "reservas": "Puedo ayudarte con la paga y señal o consultar tu reserva.",
+    "propietarios": "Área de propietarios. Contratos, liquidaciones y documentación.",
+    "franquiciados": "Área de franquiciados. Comisiones, liquidaciones y oportunidades.",
+    "oportunidades": "Oportunidades para inmobiliarias y colaboradores. ¿Quieres que te tomemos los datos?",
+    "unclear": "Perdona, no me ha quedado claro. Puedes decir reservas, propietarios, franquiciados u oportunidades.",
+    "handoff": "Te paso con un agente ahora.",
+    "listen": "Te escucho.",
+}
+MESSAGES_EN = {
+    "welcome": "Welcome to SpainRoom. You can speak in English or Spanish. How can I help you?",
+    "noinput": "I didn’t receive a response.",
+    "reservas": "I can help you with the deposit or your reservation status.",
+    "propietarios": "Landlords area. Contracts, settlements and documentation.",
+    "franquiciados": "Franchisees area. Commissions, settlements and opportunities.",
+    "oportunidades": "Opportunities for agencies and collaborators. Shall I take your details?",
+    "unclear": "Sorry, I didn’t catch that. You can say reservations, landlords, franchisees or opportunities.",
+    "handoff": "Connecting you to an agent now.",
+    "listen": "I'm listening.",
+}
 
 
 def m(lang: str, key: str) -> str:
-    ES = {
-        "welcome": "Bienvenido a SpainRoom. Puedes hablar en español o en inglés. ¿En qué puedo ayudarte?",
-        "noinput": "No recibí respuesta.",
-        "reservas": "Puedo ayudarte con la paga y señal o consultar tu reserva.",
-        "propietarios": "Área de propietarios. Contratos, liquidaciones y documentación.",
-        "franquiciados": "Área de franquiciados. Comisiones, liquidaciones y oportunidades.",
-        "oportunidades": "Oportunidades para inmobiliarias y colaboradores. ¿Quieres que te tomemos los datos?",
-        "unclear": "Perdona, no me ha quedado claro. Puedes decir reservas, propietarios, franquiciados u oportunidades.",
-        "handoff": "Te paso con un agente ahora.",
-        "listen": "Te escucho.",
-    }
-    EN = {
-        "welcome": "Welcome to SpainRoom. You can speak in English or Spanish. How can I help you?",
-        "noinput": "I didn’t receive a response.",
-        "reservas": "I can help you with the deposit or your reservation status.",
-        "propietarios": "Landlords area. Contracts, settlements and documentation.",
-        "franquiciados": "Franchisees area. Commissions, settlements and opportunities.",
-        "oportunidades": "Opportunities for agencies and collaborators. Shall I take your details?",
-        "unclear": "Sorry, I didn’t catch that. You can say reservations, landlords, franchisees or opportunities.",
-        "handoff": "Connecting you to an agent now.",
-        "listen": "I'm listening.",
-    }
-    return (EN if lang == "en" else ES)[key]
+    return (MESSAGES_EN if lang == "en" else MESSAGES_ES)[key]
 
 
-@bp_voice.route("/voice/answer", methods=["POST"])
-def voice_answer():
-    # Primer mensaje, sin opción 1/2
-    return twiml(f"""
+# ========= TwiML precompilado =========
+ANSWER = TwimlTemplate("""
 <Response>
   <Gather input="speech" language="es-ES" speechTimeout="auto"
           hints="reservas, propietarios, franquiciados, oportunidades, reservation, landlord, franchisee, opportunity, person, agent"
           action="/voice/lang-or-intent" method="POST">
-    <Say language="es-ES" voice="{VOICE_ES}">{m('es','welcome')}</Say>
+    <Say language="es-ES" voice="{voice_es}">{welcome_es}</Say>
     <Pause length="1"/>
-    <Say language="en-US" voice="{VOICE_EN}">{m('en','welcome')}</Say>
+    <Say language="en-US" voice="{voice_en}">{welcome_en}</Say>
   </Gather>
-  <Say language="es-ES" voice="{VOICE_ES}">{m('es','noinput')}</Say>
+  <Say language="es-ES" voice="{voice_es}">{noinput_es}</Say>
   <Redirect method="POST">/voice/fallback</Redirect>
 </Response>
-""".strip())
+""")
+
+MENU = TwimlTemplate("""
+<Response>
+  <Say language="{locale}" voice="{voice}">{msg}</Say>
+  <Gather input="speech" language="{locale}" speechTimeout="auto"
+          action="{action}" method="POST">
+    <Say language="{locale}" voice="{voice}">{listen}</Say>
+  </Gather>
+  <Redirect method="POST">{fallback}</Redirect>
+</Response>
+""")
+
+HANDOFF = TwimlTemplate("""
+<Response>
+  <Say language="{locale}" voice="{voice}">{msg}</Say>
+  <Dial callerId="{number}">
+    <Number>{number}</Number>
+  </Dial>
+</Response>
+""")
+
+UNCLEAR = TwimlTemplate("""
+<Response>
+  <Say language="{locale}" voice="{voice}">{msg}</Say>
+  <Redirect method="POST">{fallback}</Redirect>
+</Response>
+""")
+
+FALLBACK = TwimlTemplate("""
+<Response>
+  <Say language="{locale}" voice="{voice}">{msg}</Say>
+  <Gather input="speech" language="{locale}" speechTimeout="auto"
+          action="{action}" method="POST">
+    <Say language="{locale}" voice="{voice}">{listen}</Say>
+  </Gather>
+</Response>
+""")
+
+
+def _build_pages() -> dict:
+    """Todas las respuestas posibles: sólo dependen de (página, idioma, intención)."""
+    pages = {"answer": ANSWER.render(
+        voice_es=VOICE_ES, voice_en=VOICE_EN,
+        welcome_es=m("es", "welcome"), welcome_en=m("en", "welcome"), noinput_es=m("es", "noinput"),
+    )}
+    for lang, (locale, voice) in LOCALES.items():
+        say = {"locale": locale, "voice": voice}
+        pages["handoff", lang] = HANDOFF.render(msg=m(lang, "handoff"), number=HUMAN_FALLBACK_NUMBER, **say)
+        pages["unclear", lang] = UNCLEAR.render(msg=m(lang, "unclear"), fallback=f"/voice/fallback?lang={lang}", **say)
+        pages["fallback", lang] = FALLBACK.render(msg=m(lang, "unclear"), listen=m(lang, "listen"),
+                                                  action=f"/voice/handle-intent?lang={lang}", **say)
+        for intent in (*MENU_INTENTS, "unknown"):
+            pages["menu", lang, intent] = MENU.render(
+                msg=m(lang, intent if intent in MENU_INTENTS else "unclear"), listen=m(lang, "listen"),
+                action=f"/voice/handle-intent?i={intent}&lang={lang}", fallback=f"/voice/fallback?lang={lang}",
+                **say)
+    return pages
+
+
+PAGES = _build_pages()
+
+
+def _lang(value: str) -> str:
+    return "en" if value == "en" else "es"
+
+
+@bp_voice.route("/voice/answer", methods=["POST"])
+def voice_answer():
+    # Primer mensaje, sin opción 1/2
+    return twiml(PAGES["answer"])
 
 
 @bp_voice.route("/voice/lang-or-intent", methods=["POST"])
 def voice_lang_or_intent():
-    speech = request.values.get("SpeechResult", "")
-    lang = detect_language(speech)
-    intent = detect_intent(speech, lang)
+    call_sid = request.values.get("CallSid", "")
+    session = SESSIONS.get(call_sid)
+    # Idioma e intención en una sola pasada (voice_intents); sin pistas de idioma se mantiene el de la sesión
+    result = analyze(request.values.get("SpeechResult", ""), session["lang"])
+    lang, intent = result.lang, result.intent
+    session["lang"] = lang
+    session["intents"] = (session["intents"] + [intent])[-10:]
 
     if intent == "human":
+        SESSIONS.save(call_sid, session)
         return handoff(lang)
+    if intent == "unknown":
+        return _retry(call_sid, session, lang) or twiml(PAGES["menu", lang, "unknown"])
+    # Intención resuelta: los reintentos cuentan fallos seguidos, no los de toda la llamada
+    session["retries"] = 0
+    SESSIONS.save(call_sid, session)
+    return twiml(PAGES.get(("menu", lang, intent)) or PAGES["menu", lang, "unknown"])
 
-    msg = m(lang, intent) if intent in ("reservas", "propietarios", "franquiciados", "oportunidades") else m(lang, "unclear")
 
-    return twiml(f"""
-<Response>
-  <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{msg}</Say>
-  <Gather input="speech" language="{('en-US' if lang=='en' else 'es-ES')}" speechTimeout="auto"
-          action="/voice/handle-intent?i={intent}&lang={lang}" method="POST">
-    <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{m(lang,'listen')}</Say>
-  </Gather>
-  <Redirect method="POST">/voice/fallback?lang={lang}</Redirect>
-</Response>
-""".strip())
+def handoff(lang: str) -> Response:
+    return twiml(PAGES["handoff", _lang(lang)])
 
 
-def handoff(lang: str) -> Response:
-    return twiml(f"""
-<Response>
-  <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{m(lang,'handoff')}</Say>
-  <Dial callerId="{HUMAN_FALLBACK_NUMBER}">
-    <Number>{HUMAN_FALLBACK_NUMBER}</Number>
-  </Dial>
-</Response>
-""".strip())
+def _retry(call_sid: str, session: dict, lang: str):
+    """Cuenta un fallo seguido y guarda la sesión; pasados MAX_RETRIES devuelve el handoff a un agente."""
+    session["retries"] += 1
+    SESSIONS.save(call_sid, session)
+    if session["retries"] > MAX_RETRIES:
+        return handoff(lang)
+    return None
 
 
 @bp_voice.route("/voice/handle-intent", methods=["POST"])
 def voice_handle_intent():
-    lang = request.args.get("lang", "es")
-    speech = request.values.get("SpeechResult", "")
-    if detect_intent(speech, lang) == "human":
+    call_sid = request.values.get("CallSid", "")
+    session = SESSIONS.get(call_sid)
+    result = analyze(request.values.get("SpeechResult", ""), session["lang"] or _lang(request.args.get("lang", "es")))
+    lang = result.lang
+    if result.intent == "human":
         return handoff(lang)
-    return twiml(f"""
-<Response>
-  <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{m(lang,'unclear')}</Say>
-  <Redirect method="POST">/voice/fallback?lang={lang}</Redirect>
-</Response>
-""".strip())
+    if session["lang"] != lang:
+        session["lang"] = lang
+        SESSIONS.save(call_sid, session)
+    # El reintento lo cuenta /voice/fallback, al que redirige esta respuesta
+    return twiml(PAGES["unclear", lang])
 
 
 @bp_voice.route("/voice/fallback", methods=["POST"])
 def voice_fallback():
-    lang = detect_language(request.values.get("SpeechResult", ""))
-    return twiml(f"""
-<Response>
-  <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{m(lang,'unclear')}</Say>
-  <Gather input="speech" language="{('en-US' if lang=='en' else 'es-ES')}" speechTimeout="auto"
-          action="/voice/handle-intent?lang={lang}" method="POST">
-    <Say language="{('en-US' if lang=='en' else 'es-ES')}" voice="{(VOICE_EN if lang=='en' else VOICE_ES)}">{m(lang,'listen')}</Say>
-  </Gather>
-</Response>
-""".strip())
+    call_sid = request.values.get("CallSid", "")
+    session = SESSIONS.get(call_sid)
+    speech = request.values.get("SpeechResult", "")
+    # Idioma ya conocido: sólo se vuelve a detectar si llega habla nueva
+    hint = session["lang"] or _lang(request.args.get("lang", "es"))
+    lang = analyze(speech, hint).lang if speech else hint
+    session["lang"] = lang
+    return _retry(call_sid, session, lang) or twiml(PAGES["fallback", lang])
@@ -0,0 +1,48 @@
+# voice_buffers.py — buffers preasignados por llamada para el camino caliente del puente
+# Las tramas se decodifican, transcodifican y serializan sobre arrays reutilizados en vez de
+# crear bytes/arrays nuevos en cada una: con cientos de llamadas por worker eso se nota en GC y RSS.
+import binascii
+
+import numpy as np
+
+from voice_codec import ulaw_decode, ulaw_encode
+
+def b64_text(data) -> str:
+    """Base64 (str ASCII) de cualquier bytes-like; lee memoryviews sin copiarlas."""
+    return binascii.b2a_base64(data, newline=False).decode("ascii")
+
+def b64_bytes(text: str) -> bytes:
+    """Decodifica base64 directamente desde el str (base64.b64decode lo re-codifica antes a bytes)."""
+    return binascii.a2b_base64(text)
+
+class FrameBuffers:
+    """
+    Arrays de trabajo de un sentido de una llamada (µ-law <-> PCM16).
+    Los métodos devuelven vistas de los buffers internos, válidas hasta la siguiente llamada
+    al mismo método: el consumidor debe copiarlas antes de ceder el control
+    (FrameCoalescer.push y LegQueue.put_audio ya copian).
+    Crecen (una vez) si llega una trama mayor que la capacidad inicial.
+    """
+
+    def __init__(self, max_samples: int = 4096):
+        self._pcm = np.empty(max_samples, dtype=np.int16)    # µ-law decodificado
+        self._idx = np.empty(max_samples, dtype=np.uint16)   # índice de 14 bits para codificar
+        self._ulaw = np.empty(max_samples, dtype=np.uint8)   # µ-law codificado
+
+    def _ensure(self, n: int) -> None:
+        if n > self._pcm.size:
+            size = max(n, 2 * self._pcm.size)
+            self._pcm = np.empty(size, dtype=np.int16)
+            self._idx = np.empty(size, dtype=np.uint16)
+            self._ulaw = np.empty(size, dtype=np.uint8)
+
+    def decode(self, ulaw) -> np.ndarray:
+        """µ-law (bytes-like) -> vista int16."""
+        n = memoryview(ulaw).nbytes
+        self._ensure(n)
+        return ulaw_decode(ulaw, out=self._pcm)
+
+    def encode(self, pcm16: np.ndarray) -> np.ndarray:
+        """PCM16 -> vista uint8 con el µ-law."""
+        self._ensure(pcm16.size)
+        return ulaw_encode(pcm16, out=self._ulaw, scratch=self._idx)
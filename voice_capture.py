@@ -0,0 +1,73 @@
+# voice_capture.py — captura binaria del audio crudo de una sesión del gateway
+# Formato (little-endian):
+#   "VCAP" | versión u8 | longitud u32 | metadatos JSON (utf-8)
+#   registros: tipo u8 | ms desde el inicio u32 | longitud u32 | payload (audio ya sin base64)
+# Tipos: 1 = media de Twilio (µ-law 8k), 2 = response.audio.delta del modelo
+#        (µ-law 8k o PCM16 16k según metadatos["passthrough"]).
+# La reproduce voice_replay.py.
+import json
+import os
+import struct
+import time
+from typing import Iterator, Tuple
+
+MAGIC = b"VCAP"
+VERSION = 1
+KIND_TWILIO_MEDIA = 1
+KIND_MODEL_DELTA = 2
+
+_HEADER = struct.Struct("<4sBI")
+_RECORD = struct.Struct("<BII")
+
+class CaptureWriter:
+    """
+    Escritura con buffer de 64 KB: cada registro es un `write` a memoria salvo cuando se llena.
+    Pensada para diagnóstico y benchmarks; la grabación de llamadas para QA es voice_recorder.
+    """
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "wb", buffering=64 * 1024)
+        header = json.dumps(meta).encode("utf-8")
+        self._f.write(_HEADER.pack(MAGIC, VERSION, len(header)))
+        self._f.write(header)
+        self._t0 = time.monotonic()
+        self.records = 0
+
+    def write(self, kind: int, payload) -> None:
+        if self._f is None:
+            return
+        data = memoryview(payload).cast("B")
+        t_ms = int((time.monotonic() - self._t0) * 1000)
+        self._f.write(_RECORD.pack(kind, t_ms, data.nbytes))
+        self._f.write(data)
+        self.records += 1
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+def read_capture(path: str) -> Tuple[dict, Iterator[Tuple[int, int, bytes]]]:
+    """Devuelve (metadatos, iterador de (tipo, ms, payload))."""
+    f = open(path, "rb")
+    magic, version, hlen = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        f.close()
+        raise ValueError(f"{path}: no es una captura VCAP v{VERSION}")
+    meta = json.loads(f.read(hlen).decode("utf-8"))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(_RECORD.size)
+                if len(head) < _RECORD.size:
+                    return
+                kind, t_ms, n = _RECORD.unpack(head)
+                payload = f.read(n)
+                if len(payload) < n:
+                    return  # captura cortada (p. ej. el proceso murió): se ignora el último registro
+                yield kind, t_ms, payload
+
+    return meta, records()
@@ -0,0 +1,60 @@
+# voice_coalesce.py — agrupa tramas de 20 ms de Twilio antes de input_audio_buffer.append
+# Un objeto por llamada: buffer preasignado de `window_ms` de audio que se vacía
+# cuando se llena, por temporizador (audio pendiente más antiguo que la ventana) o en `stop`.
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+class FrameCoalescer:
+    """
+    Acumula audio (bytes-like) y llama a `send(chunk)` con bloques de hasta `window_ms`.
+    `chunk` es una vista del buffer interno: `send` debe copiarla antes de su primer await
+    (LegQueue.put_audio lo hace). `bytes_per_ms`: 8 para µ-law 8k, 32 para PCM16 16k.
+    """
+
+    def __init__(self, window_ms: int, bytes_per_ms: int, send: Callable[[bytes], Awaitable[None]]):
+        self.window_ms = max(1, int(window_ms))
+        self.capacity = self.window_ms * bytes_per_ms
+        self._buf = bytearray(self.capacity)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._first_ts = 0.0
+        self._send = send
+        # Contadores por llamada
+        self.frames_in = 0
+        self.messages_out = 0
+
+    @property
+    def pending(self) -> int:
+        return self._len
+
+    async def push(self, data) -> None:
+        """Copia una trama al buffer; envía cada vez que se completa una ventana."""
+        src = memoryview(data).cast("B")
+        self.frames_in += 1
+        while src.nbytes:
+            if self._len == 0:
+                self._first_ts = time.monotonic()
+            n = min(src.nbytes, self.capacity - self._len)
+            self._mv[self._len:self._len + n] = src[:n]
+            self._len += n
+            src = src[n:]
+            if self._len == self.capacity:
+                await self.flush()
+
+    async def flush(self) -> None:
+        """Entrega lo pendiente (si hay) como vista; el buffer queda libre antes del await."""
+        if not self._len:
+            return
+        chunk = self._mv[:self._len]
+        self._len = 0
+        self.messages_out += 1
+        await self._send(chunk)
+
+    async def run_timer(self) -> None:
+        """Tarea de fondo: vacía el buffer si el audio pendiente supera la ventana (p. ej. pausas de Twilio)."""
+        window_s = self.window_ms / 1000.0
+        while True:
+            await asyncio.sleep(window_s / 2)
+            if self._len and time.monotonic() - self._first_ts >= window_s:
+                await self.flush()
@@ -0,0 +1,65 @@
+# voice_codec.py — G.711 µ-law <-> PCM16 por tablas precalculadas
+# Bit-exacto con ITU-T G.711 (referencia G.191 ulaw_compress / ulaw_expand).
+from typing import Optional
+
+import numpy as np
+
+# ========= TABLAS =========
+def _build_decode_table() -> np.ndarray:
+    """256 entradas: byte µ-law -> muestra PCM16 (escala 16 bits, |x| <= 32124)."""
+    table = np.empty(256, dtype=np.int16)
+    for code in range(256):
+        sign = -1 if code < 0x80 else 1
+        mantissa = ~code & 0xFF
+        exponent = (mantissa >> 4) & 0x07
+        step = 4 << (exponent + 1)
+        mantissa &= 0x0F
+        table[code] = sign * ((0x80 << exponent) + step * mantissa + step // 2 - 4 * 33)
+    return table
+
+def _build_encode_table() -> np.ndarray:
+    """16384 entradas: muestra de 14 bits (PCM16 >> 2, complemento a dos) -> byte µ-law."""
+    table = np.empty(1 << 14, dtype=np.uint8)
+    for idx in range(1 << 14):
+        x = idx - (1 << 14) if idx & 0x2000 else idx   # extiende el signo de 14 bits
+        absno = (~x if x < 0 else x) + 33
+        if absno > 0x1FFF:
+            absno = 0x1FFF
+        segno = absno.bit_length() - 5                  # equivale al bucle de G.191
+        out = ((8 - segno) << 4) | (0x0F - ((absno >> segno) & 0x0F))
+        if x >= 0:
+            out |= 0x80
+        table[idx] = out
+    return table
+
+ULAW_DECODE_TABLE = _build_decode_table()
+ULAW_ENCODE_TABLE = _build_encode_table()
+
+# ========= API =========
+def ulaw_decode(ulaw_bytes: bytes, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Bytes µ-law -> PCM16 (int16). Un único `take` sobre la tabla de 256.
+    Con `out` (int16, tamaño >= entrada) escribe ahí y devuelve la vista `out[:n]`.
+    """
+    codes = np.frombuffer(ulaw_bytes, dtype=np.uint8)
+    if out is None:
+        return ULAW_DECODE_TABLE.take(codes)
+    dst = out[: codes.size]
+    ULAW_DECODE_TABLE.take(codes, out=dst, mode="clip")  # "raise" usaría un buffer temporal
+    return dst
+
+def ulaw_encode(pcm16: np.ndarray, out: Optional[np.ndarray] = None,
+                scratch: Optional[np.ndarray] = None):
+    """
+    PCM16 (int16) -> µ-law. Un único `take` sobre la tabla de 14 bits.
+    Sin `out` devuelve bytes; con `out` (uint8) y `scratch` (uint16), ambos de tamaño >= entrada,
+    no reserva memoria y devuelve la vista `out[:n]`.
+    """
+    pcm16 = np.asarray(pcm16, dtype=np.int16)
+    if out is None:
+        return ULAW_ENCODE_TABLE.take(pcm16.view(np.uint16) >> 2).tobytes()
+    n = pcm16.size
+    idx = np.right_shift(pcm16.view(np.uint16), 2, out=scratch[:n] if scratch is not None else None)
+    dst = out[:n]
+    ULAW_ENCODE_TABLE.take(idx, out=dst, mode="clip")
+    return dst
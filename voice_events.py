@@ -0,0 +1,118 @@
+# voice_events.py — callbacks de estado de Twilio a SQLite sin bloquear el webhook
+# El handler sólo encola el formulario (acotado por `max_pending`); un hilo escritor vacía
+# la cola por lotes con un único executemany + commit por lote. En ráfagas de un número con
+# mucho tráfico el webhook responde igual de rápido; si la cola se llena, el evento se descarta
+# y se cuenta (Twilio no reintenta los status callbacks, pero tampoco debe esperar).
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "data", "call_events.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS call_events (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  call_sid TEXT NOT NULL,
+  ts REAL NOT NULL,          -- epoch (s) de recepción en el backend
+  status TEXT,               -- CallStatus (initiated, ringing, answered, completed...)
+  sequence INTEGER,          -- SequenceNumber de Twilio (orden real entre eventos de la llamada)
+  payload TEXT NOT NULL      -- formulario completo en JSON
+);
+CREATE INDEX IF NOT EXISTS idx_call_events_sid_ts ON call_events (call_sid, ts);
+"""
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class CallEventSink:
+    """Un hilo escritor por proceso (se arranca con el primer evento)."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, batch: int = 500, max_pending: int = 10000):
+        self.path = path
+        self.batch = max(1, int(batch))
+        self.max_pending = max(1, int(max_pending))
+        self._q: "queue.Queue[Tuple]" = queue.Queue(maxsize=self.max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Contadores del worker
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- webhook ----------
+    def submit(self, form: dict) -> bool:
+        """Encola el callback; nunca espera. False si la cola está llena (evento descartado)."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="call-events", daemon=True)
+                    self._thread.start()
+        row = (
+            form.get("CallSid") or "",
+            time.time(),
+            form.get("CallStatus"),
+            _int(form.get("SequenceNumber")),
+            json.dumps(form, ensure_ascii=False),
+        )
+        try:
+            self._q.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self) -> dict:
+        return {"pending": self._q.qsize(), "written": self.written,
+                "dropped": self.dropped, "errors": self.errors}
+
+    # ---------- consultas ----------
+    def timeline(self, call_sid: str) -> List[dict]:
+        """Eventos de una llamada en orden (índice call_sid, ts)."""
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT ts, status, sequence, payload FROM call_events WHERE call_sid = ? ORDER BY ts, id",
+                (call_sid,),
+            ).fetchall()
+        return [
+            {"ts": r["ts"], "status": r["status"], "sequence": r["sequence"], "data": json.loads(r["payload"])}
+            for r in rows
+        ]
+
+    # ---------- hilo escritor ----------
+    def _run(self) -> None:
+        conn = self._conn()
+        while True:
+            rows = [self._q.get()]
+            while len(rows) < self.batch:
+                try:
+                    rows.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO call_events (call_sid, ts, status, sequence, payload) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                self.written += len(rows)
+            except Exception as e:
+                self.errors += 1
+                print("[CALL EVENTS] error escribiendo lote de", len(rows), e)
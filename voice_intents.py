@@ -0,0 +1,173 @@
+# voice_intents.py — detección de idioma e intención del bot de voz en una sola pasada
+# Las tablas ES/EN se compilan una vez en diccionarios (palabra, raíz, frase); el texto se
+# normaliza (minúsculas, sin tildes) y cada coincidencia suma a la puntuación del idioma
+# y de la intención. Corpus etiquetado: data/voice_intents_corpus.tsv (con el que se escribieron
+# las tablas) y data/voice_intents_heldout.tsv (de control, no se usa para ajustarlas);
+# benchmark y precisión: bench_voice_intents.py.
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+LANGS = ("es", "en")
+# Orden de desempate entre intenciones con la misma puntuación (el del código original)
+INTENTS = ("reservas", "propietarios", "franquiciados", "oportunidades", "human")
+
+# "raiz*" = cualquier palabra que empiece por la raíz; si no, palabra o frase exacta.
+# Todo en forma normalizada (sin tildes).
+INTENT_KEYWORDS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "reservas": {
+        "es": ("reserva*", "senal", "paga y senal", "deposito", "fianza", "apartar*"),
+        "en": ("reservation*", "reserve*", "booking*", "book", "deposit", "deposits", "down payment"),
+    },
+    "propietarios": {
+        "es": ("propietari*", "dueno*", "casero*", "arrendador*", "mi piso", "mi vivienda", "tengo un piso"),
+        "en": ("landlord*", "owner*", "i own", "my property", "my flat", "my apartment"),
+    },
+    "franquiciados": {
+        "es": ("franquici*", "comision*"),
+        "en": ("franchis*", "commission*"),
+    },
+    "oportunidades": {
+        "es": ("oportunidad*", "colaborador*", "colaborar", "inmobiliaria*", "socio", "socios"),
+        "en": ("opportunit*", "partner*", "collaborat*", "agency", "agencies", "real estate"),
+    },
+    "human": {
+        "es": ("persona", "agente", "agentes", "operador*", "humano", "asesor*", "alguien"),
+        "en": ("person", "agent", "agents", "operator*", "human", "someone", "representative*"),
+    },
+}
+
+# Palabras frecuentes que sólo aportan idioma
+LANG_CUES: Dict[str, Tuple[str, ...]] = {
+    "es": ("hola", "buenos", "buenas", "quiero", "quisiera", "necesito", "tengo", "hablar", "llamo",
+           "gracias", "por favor", "sobre", "una", "mi", "con", "del", "para", "que", "como", "donde",
+           "cuando", "pagar", "habitacion*", "piso", "alquil*", "estoy", "soy", "es", "el", "los", "las"),
+    "en": ("hello", "hi", "hey", "i", "want", "would", "like", "need", "have", "my", "the", "please",
+           "thanks", "thank", "speak", "talk", "about", "with", "room*", "rent*", "pay", "how", "where",
+           "when", "am", "is", "can", "could", "to", "for", "sorry"),
+}
+
+INTENT_WEIGHT = 2   # a la intención y a su idioma
+CUE_WEIGHT = 1      # sólo al idioma
+
+# Tabla de bytes (ASCII): mayúsculas a minúsculas y puntuación a espacios; después basta con
+# str.split(). bytes.translate es varias veces más rápido que str.translate con diccionario.
+_FOLD = bytearray(range(256))
+_FOLD[ord("A"):ord("Z") + 1] = range(ord("a"), ord("z") + 1)
+for _c in b".,;:!?\"'()[]-/":
+    _FOLD[_c] = ord(" ")
+_FOLD = bytes(_FOLD)
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes y sin puntuación (el reconocedor de Twilio no siempre pone tildes)."""
+    text = text or ""
+    if text.isascii():
+        data = text.encode()
+    else:
+        # NFD separa tildes/diéresis/virgulilla de la letra; al pasar a ASCII se quedan fuera (y ¿¡)
+        data = unicodedata.normalize("NFD", text.replace("’", " ")).encode("ascii", "ignore")
+    return data.translate(_FOLD).decode()
+
+class Analysis(NamedTuple):
+    lang: str
+    intent: str            # una de INTENTS o "unknown"
+    lang_scores: Tuple[int, int]   # (es, en)
+    intent_score: int
+
+Entry = Tuple[int, int, int]  # (índice en INTENTS | -1 si sólo aporta idioma, índice de idioma, peso)
+
+class IntentMatcher:
+    """
+    Compila las tablas en diccionarios: palabra exacta, raíz (por longitud) y frases por primera
+    palabra. `analyze` recorre las palabras una sola vez; la resolución palabra -> entrada se
+    memoriza, así que el vocabulario habitual de las llamadas cuesta un lookup por palabra.
+    Las puntuaciones van en listas por índice: el orden de INTENTS es el de desempate.
+    """
+
+    MEMO_MAX = 20000
+
+    def __init__(self, intent_keywords=INTENT_KEYWORDS, lang_cues=LANG_CUES):
+        self._exact: Dict[str, Entry] = {}
+        self._stems: Dict[str, Entry] = {}
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], Entry]]] = {}
+
+        def add(word: str, entry: Entry) -> None:
+            word = normalize(word.rstrip("*")).strip() + ("*" if word.endswith("*") else "")
+            if " " in word:
+                words = tuple(word.split())
+                self._phrases.setdefault(words[0], []).append((words, entry))
+            elif word.endswith("*"):
+                self._stems.setdefault(word[:-1], entry)
+            else:
+                self._exact.setdefault(word, entry)
+
+        for intent, by_lang in intent_keywords.items():
+            for lang, words in by_lang.items():
+                for w in words:
+                    add(w, (INTENTS.index(intent), LANGS.index(lang), INTENT_WEIGHT))
+        for lang, words in lang_cues.items():
+            for w in words:
+                add(w, (-1, LANGS.index(lang), CUE_WEIGHT))
+        for options in self._phrases.values():
+            options.sort(key=lambda p: -len(p[0]))  # frase más larga primero
+        # Raíz más larga primero: "reservation*" gana a "reserva*"
+        self._stem_lens = sorted({len(s) for s in self._stems}, reverse=True)
+        self._phrase_heads = frozenset(self._phrases)
+        self._memo: Dict[str, Optional[Entry]] = {}
+
+    def _word(self, word: str) -> Optional[Entry]:
+        entry = self._exact.get(word)
+        if entry is None:
+            for n in self._stem_lens:
+                if n <= len(word):
+                    entry = self._stems.get(word[:n])
+                    if entry is not None:
+                        break
+        if len(self._memo) >= self.MEMO_MAX:
+            self._memo.clear()
+        self._memo[word] = entry
+        return entry
+
+    def _apply_phrases(self, words: List[str], hits: List[Optional[Entry]]) -> None:
+        """Sustituye en `hits` las palabras que forman una frase clave por la entrada de la frase."""
+        i, n = 0, len(words)
+        while i < n:
+            for phrase, entry in self._phrases.get(words[i], ()):
+                k = len(phrase)
+                if tuple(words[i:i + k]) == phrase:
+                    hits[i:i + k] = [entry] + [None] * (k - 1)
+                    i += k - 1
+                    break
+            i += 1
+
+    def analyze(self, text: str, lang_hint: Optional[str] = None) -> Analysis:
+        words = normalize(text).split()
+        memo = self._memo
+        hits = [memo[w] if w in memo else self._word(w) for w in words]
+        if not self._phrase_heads.isdisjoint(words):
+            self._apply_phrases(words, hits)
+
+        lang_scores = [0, 0]
+        intent_scores = [0] * len(INTENTS)
+        for entry in hits:
+            if entry is not None:
+                intent, lang_idx, weight = entry
+                lang_scores[lang_idx] += weight
+                if intent >= 0:
+                    intent_scores[intent] += weight
+
+        es, en = lang_scores
+        if es != en:
+            lang = "en" if en > es else "es"
+        else:
+            lang = lang_hint if lang_hint in LANGS else "es"
+
+        best = max(intent_scores)
+        if not best:
+            return Analysis(lang, "unknown", (es, en), 0)
+        # index() devuelve la primera: a igual puntuación gana la de mayor prioridad
+        return Analysis(lang, INTENTS[intent_scores.index(best)], (es, en), best)
+
+MATCHER = IntentMatcher()
+
+def analyze(text: str, lang_hint: Optional[str] = None) -> Analysis:
+    return MATCHER.analyze(text, lang_hint)
@@ -0,0 +1,138 @@
+# voice_metrics.py — métricas del gateway de voz (por llamada y agregadas por worker)
+# Sin dependencias: histogramas y contadores propios, exportados en formato texto de Prometheus.
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+
+# Etapas del puente (segundos)
+STAGES = (
+    "twilio_receive",     # parseo de un mensaje de Twilio (JSON + base64)
+    "decode",             # µ-law -> PCM16 (sólo transcodificando)
+    "resample",           # 8k <-> 16k (sólo transcodificando)
+    "send_to_model",      # await ws_ai.send de un mensaje
+    "first_model_delta",  # fin de habla del llamante (speech_stopped) -> primer audio del modelo
+    "encode",             # PCM16 -> µ-law (sólo transcodificando)
+    "send_to_twilio",     # await ws_twilio.send_text de un mensaje
+)
+
+# De 10 µs (codec) a 10 s (respuesta del modelo)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        acc = 0
+        for le, c in zip(self.buckets, self.counts):
+            acc += c
+            yield f'{name}_bucket{{{labels},le="{le}"}} {acc}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+class GatewayMetrics:
+    """Agregado por worker: histogramas por etapa y contadores de llamadas/tramas/bytes."""
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {s: Histogram() for s in STAGES}
+        self.counters: Dict[str, int] = {
+            "calls_total": 0, "frames_in_total": 0, "frames_out_total": 0,
+            "bytes_in_total": 0, "bytes_out_total": 0,
+            "vad_frames_suppressed_total": 0,  # tramas de silencio que el VAD local no envió al modelo
+        }
+        self.active_calls = 0
+
+    def render(self, extra_gauges: Dict[str, float] = None) -> str:
+        lines = [
+            "# HELP voice_stage_seconds Duración por etapa del puente Twilio <-> Realtime.",
+            "# TYPE voice_stage_seconds histogram",
+        ]
+        for stage, hist in self.stages.items():
+            lines.extend(hist.render("voice_stage_seconds", f'stage="{stage}"'))
+        for key, value in self.counters.items():
+            lines.append(f"# TYPE voice_{key} counter")
+            lines.append(f"voice_{key} {value}")
+        lines.append("# TYPE voice_active_calls gauge")
+        lines.append(f"voice_active_calls {self.active_calls}")
+        for key, value in (extra_gauges or {}).items():
+            lines.append(f"# TYPE voice_{key} gauge")
+            lines.append(f"voice_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+GATEWAY = GatewayMetrics()
+
+class CallMetrics:
+    """Métricas de una llamada: alimenta el agregado y resume la llamada al terminar."""
+
+    def __init__(self, registry: GatewayMetrics = GATEWAY):
+        self._registry = registry
+        self.started = time.monotonic()
+        self.frames_in = self.frames_out = 0
+        self.bytes_in = self.bytes_out = 0
+        self.first_audio_s = None   # inicio de la llamada -> primer audio del modelo
+        self._turn_ts = None        # speech_stopped pendiente de primer delta
+        self._stage_sum = dict.fromkeys(STAGES, 0.0)
+        self._stage_max = dict.fromkeys(STAGES, 0.0)
+        self._stage_n = dict.fromkeys(STAGES, 0)
+        registry.counters["calls_total"] += 1
+        registry.active_calls += 1
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self._registry.stages[stage].observe(seconds)
+        self._stage_sum[stage] += seconds
+        self._stage_n[stage] += 1
+        if seconds > self._stage_max[stage]:
+            self._stage_max[stage] = seconds
+
+    def frame_in(self, nbytes: int) -> None:
+        self.frames_in += 1
+        self.bytes_in += nbytes
+
+    def frame_out(self, nbytes: int) -> None:
+        self.frames_out += 1
+        self.bytes_out += nbytes
+
+    def speech_stopped(self) -> None:
+        self._turn_ts = time.monotonic()
+
+    def model_delta(self) -> None:
+        now = time.monotonic()
+        if self.first_audio_s is None:
+            self.first_audio_s = now - self.started
+        if self._turn_ts is not None:
+            self.observe("first_model_delta", now - self._turn_ts)
+            self._turn_ts = None
+
+    def close(self) -> dict:
+        """Vuelca contadores al agregado y devuelve el resumen de la llamada (ms)."""
+        c = self._registry.counters
+        c["frames_in_total"] += self.frames_in
+        c["frames_out_total"] += self.frames_out
+        c["bytes_in_total"] += self.bytes_in
+        c["bytes_out_total"] += self.bytes_out
+        self._registry.active_calls -= 1
+        stages = {
+            s: {"n": n, "avg_ms": round(self._stage_sum[s] / n * 1000, 3), "max_ms": round(self._stage_max[s] * 1000, 3)}
+            for s, n in self._stage_n.items() if n
+        }
+        return {
+            "duration_s": round(time.monotonic() - self.started, 3),
+            "first_audio_ms": None if self.first_audio_s is None else round(self.first_audio_s * 1000, 1),
+            "frames_in": self.frames_in, "bytes_in": self.bytes_in,
+            "frames_out": self.frames_out, "bytes_out": self.bytes_out,
+            "stages": stages,
+        }
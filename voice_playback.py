@@ -0,0 +1,70 @@
+# voice_playback.py — seguimiento de reproducción en Twilio para barge-in
+# Cada bloque de audio que sale hacia Twilio va seguido de un <mark> con el ms acumulado del
+# item (sólo del audio enviado: lo fusionado o descartado en la cola no cuenta); Twilio lo
+# devuelve cuando lo ha reproducido. Así sabemos cuánto ha oído el llamante y, si interrumpe,
+# cuánto truncar en la conversación del modelo.
+from typing import Optional, Set, Tuple
+
+ULAW_BYTES_PER_MS = 8  # µ-law 8 kHz
+
+class PlaybackTracker:
+    def __init__(self):
+        self.queued_item: Optional[str] = None  # último item encolado hacia Twilio
+        self.item_id: Optional[str] = None      # item que se está enviando a Twilio
+        self.sent_bytes = 0  # audio del item actual entregado a Twilio
+        self.played_ms = 0   # audio del item actual confirmado por <mark>
+        self._cut: Set[str] = set()
+        # Contadores por llamada
+        self.barge_ins = 0
+        self.cleared_ms = 0
+
+    @property
+    def sent_ms(self) -> int:
+        return self.sent_bytes // ULAW_BYTES_PER_MS
+
+    def is_cut(self, item_id: str) -> bool:
+        """True si el item fue interrumpido: sus deltas restantes no se envían."""
+        return item_id in self._cut
+
+    def on_queued(self, item_id: str) -> None:
+        """Se encola audio del item (aún no enviado)."""
+        self.queued_item = item_id
+
+    def on_sent(self, item_id: str, ulaw_bytes: int) -> Optional[str]:
+        """Sale hacia Twilio un bloque del item; devuelve el nombre del <mark> a enviar detrás (None si está cortado)."""
+        if item_id in self._cut:
+            return None
+        if item_id != self.item_id:
+            self.item_id, self.sent_bytes, self.played_ms = item_id, 0, 0
+        self.sent_bytes += ulaw_bytes
+        return f"{item_id}:{self.sent_ms}"
+
+    def on_mark(self, name: str) -> None:
+        """Twilio ha reproducido hasta el mark `name`."""
+        item_id, _, ms = (name or "").rpartition(":")
+        if item_id and item_id == self.item_id and ms.isdigit():
+            self.played_ms = max(self.played_ms, int(ms))
+
+    def interrupt(self, pending_bytes: int = 0) -> Optional[Tuple[str, int]]:
+        """
+        El llamante empieza a hablar. `pending_bytes`: audio aún en la cola hacia Twilio.
+        Si queda audio sin reproducir devuelve (item_id, played_ms) para enviar `clear` a Twilio
+        y `conversation.item.truncate` al modelo; si no, None.
+        """
+        item_id = self.queued_item
+        if not item_id or item_id in self._cut:
+            return None
+        unplayed = (self.sent_ms - self.played_ms) if item_id == self.item_id else 0
+        if unplayed <= 0 and pending_bytes <= 0:
+            return None
+        played = self.played_ms if item_id == self.item_id else 0
+        self._cut.add(item_id)
+        if self.item_id:
+            self._cut.add(self.item_id)
+        self.barge_ins += 1
+        self.cleared_ms += max(0, self.sent_ms - self.played_ms) + pending_bytes // ULAW_BYTES_PER_MS
+        self.queued_item, self.item_id, self.sent_bytes, self.played_ms = None, None, 0, 0
+        return item_id, played
+
+    def stats(self) -> dict:
+        return {"barge_ins": self.barge_ins, "cleared_ms": self.cleared_ms}
@@ -0,0 +1,88 @@
+# voice_pool.py — pool de sesiones Realtime ya conectadas y configuradas
+# Cada llamada nueva reclama una sesión lista (TLS + upgrade + session.update ya hechos)
+# en vez de pagar ese round trip antes de poder oír al llamante.
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple
+
+class RealtimePool:
+    """
+    Mantiene hasta `size` sesiones abiertas con `connect()` (que devuelve el WS ya configurado).
+    - `acquire()` entrega la sesión más reciente que siga abierta, o None (el llamador conecta en frío).
+    - Las sesiones con más de `idle_s` segundos en el pool se cierran y se reponen.
+    - `run()` es la tarea de fondo que rellena el pool (con backoff si falla la conexión).
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[Any]], size: int = 2, idle_s: float = 300.0):
+        self._connect = connect
+        self.size = max(0, int(size))
+        self.idle_s = float(idle_s)
+        self._ready: Deque[Tuple[float, Any]] = deque()
+        self._wake = asyncio.Event()
+        # Contadores del worker
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failures = 0
+
+    @property
+    def ready(self) -> int:
+        return len(self._ready)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "ready": self.ready, "hits": self.hits, "misses": self.misses,
+                "expired": self.expired, "failures": self.failures}
+
+    def _fresh(self, ts: float, ws: Any) -> bool:
+        return getattr(ws, "open", True) and time.monotonic() - ts < self.idle_s
+
+    async def acquire(self) -> Optional[Any]:
+        """Sesión lista o None. Nunca espera a una conexión nueva."""
+        while self._ready:
+            ts, ws = self._ready.pop()
+            self._wake.set()
+            if self._fresh(ts, ws):
+                self.hits += 1
+                return ws
+            self.expired += 1
+            asyncio.create_task(self._close(ws))
+        self.misses += 1
+        self._wake.set()
+        return None
+
+    async def _close(self, ws: Any) -> None:
+        with contextlib.suppress(Exception):
+            await ws.close()
+
+    async def run(self) -> None:
+        """Tarea de fondo: caduca sesiones viejas y repone hasta `size`."""
+        backoff = 1.0
+        while True:
+            while self._ready and not self._fresh(*self._ready[0]):
+                _, ws = self._ready.popleft()
+                self.expired += 1
+                await self._close(ws)
+
+            while len(self._ready) < self.size:
+                try:
+                    ws = await self._connect()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.failures += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(30.0, backoff * 2)
+                    continue
+                backoff = 1.0
+                self._ready.append((time.monotonic(), ws))
+
+            self._wake.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=min(5.0, self.idle_s / 4))
+
+    async def close(self) -> None:
+        while self._ready:
+            _, ws = self._ready.pop()
+            await self._close(ws)
@@ -0,0 +1,213 @@
+# voice_queues.py — colas acotadas entre las dos patas WS del gateway (Twilio <-> Realtime)
+# Cada sentido es productor/consumidor: quien recibe sólo encola y una tarea aparte envía.
+# Así un par lento no bloquea las lecturas del otro y la memoria por llamada queda acotada.
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Union
+
+POLICIES = ("merge", "drop_oldest", "drop_newest", "block")
+
+class _Audio:
+    """Bloque de audio encolado y su `tag` (p. ej. item_id del modelo para el <mark> de Twilio)."""
+    __slots__ = ("buf", "tag")
+
+    def __init__(self, buf: bytearray, tag: Any = None):
+        self.buf = buf
+        self.tag = tag
+
+class LegQueue:
+    """
+    Cola acotada de salida hacia un WebSocket.
+    - Audio (bytes): se puede descartar o fusionar según `policy`; se serializa con `encode_audio` al enviar.
+    - Control (str): JSON ya serializado; nunca se descarta ni se fusiona.
+    - Marcas: no ocupan sitio en la cola. El audio encolado con `tag` lleva su marca consigo:
+      al enviarlo se llama `encode_mark(tag, bytes)` y, si devuelve texto, se envía justo detrás.
+      Así la marca se fusiona o se descarta con su audio y sólo cuenta el audio que sale de verdad.
+    Límites: `max_items` mensajes y `max_bytes` de audio. Al superarlos:
+      merge        -> el audio nuevo se añade al último bloque de audio encolado si es del mismo `tag`
+                      (mismo audio, menos mensajes);
+                      si aun así se pasa de `max_bytes`, se recorta el audio más antiguo
+      drop_oldest  -> se descarta el audio más antiguo
+      drop_newest  -> se descarta el audio entrante
+      block        -> el productor espera (contrapresión real hacia el otro WS)
+    """
+
+    def __init__(self, name: str, send: Callable[[str], Awaitable[None]], encode_audio: Callable[[bytearray], str],
+                 max_items: int = 50, max_bytes: int = 64000, policy: str = "merge",
+                 on_send: Optional[Callable[[float], None]] = None,
+                 encode_mark: Optional[Callable[[Any, int], Optional[str]]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"política de cola no válida: {policy}")
+        self.name = name
+        self.policy = policy
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = max(1, int(max_bytes))
+        self._send = send
+        self._encode_audio = encode_audio
+        self._on_send = on_send  # recibe la duración (s) de cada envío
+        self._encode_mark = encode_mark
+        self._items: Deque[Union[_Audio, str]] = deque()
+        self._free: List[bytearray] = []  # bloques ya enviados/descartados, se reutilizan en put_audio
+        self._audio_bytes = 0
+        self._not_empty = asyncio.Event()
+        self._space = asyncio.Event()   # se activa cada vez que el consumidor saca un elemento
+        self.closed = False
+        # Contadores por llamada
+        self.enqueued = 0
+        self.sent = 0
+        self.merged = 0
+        self.dropped_frames = 0
+        self.dropped_bytes = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    @property
+    def audio_bytes(self) -> int:
+        """Audio encolado pendiente de enviar."""
+        return self._audio_bytes
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth, "max_depth": self.max_depth, "enqueued": self.enqueued, "sent": self.sent,
+            "merged": self.merged, "dropped_frames": self.dropped_frames, "dropped_bytes": self.dropped_bytes,
+        }
+
+    # ---------- productor ----------
+    def _full(self, incoming: int) -> bool:
+        return len(self._items) >= self.max_items or self._audio_bytes + incoming > self.max_bytes
+
+    def _recycle(self, buf: bytearray) -> None:
+        if len(self._free) < self.max_items:
+            self._free.append(buf)
+
+    def _drop_oldest_audio(self) -> bool:
+        for i, item in enumerate(self._items):
+            if isinstance(item, _Audio):
+                del self._items[i]
+                self._audio_bytes -= len(item.buf)
+                self.dropped_frames += 1
+                self.dropped_bytes += len(item.buf)
+                self._recycle(item.buf)
+                return True
+        return False
+
+    def _trim_oldest_audio(self, excess: int) -> None:
+        """Elimina `excess` bytes del audio más antiguo (bloques enteros mientras quepa, luego recorta)."""
+        for item in list(self._items):
+            if excess <= 0:
+                return
+            if not isinstance(item, _Audio):
+                continue
+            if len(item.buf) <= excess and item is not self._items[-1]:
+                self._items.remove(item)
+                self.dropped_frames += 1
+                cut = len(item.buf)
+                self._recycle(item.buf)
+            else:
+                cut = min(excess, len(item.buf))
+                del item.buf[:cut]
+            self._audio_bytes -= cut
+            self.dropped_bytes += cut
+            excess -= cut
+
+    def _enqueued(self) -> None:
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._not_empty.set()
+
+    async def put_audio(self, data, tag: Any = None) -> None:
+        """
+        Encola audio (bytes-like). Se copia antes de cualquier await, así que `data` puede ser
+        una vista de un buffer que el llamador reutiliza. Sólo espera con policy='block'.
+        `tag` != None: al enviarse se pide su marca a `encode_mark`.
+        """
+        if self.closed:
+            return
+        data = memoryview(data).cast("B")
+        n = data.nbytes
+        if self.policy == "drop_newest" and self._full(n):
+            self.dropped_frames += 1
+            self.dropped_bytes += n
+            return
+        last = self._items[-1] if self._items else None
+        if self.policy == "merge" and self._full(n) and isinstance(last, _Audio) and last.tag == tag:
+            last.buf += data
+            self._audio_bytes += n
+            self.merged += 1
+            self._trim_oldest_audio(self._audio_bytes - self.max_bytes)
+            return
+        buf = self._free.pop() if self._free else bytearray()
+        buf[:] = data
+        if self.policy == "block":
+            while self._full(n) and self._items and not self.closed:
+                self._space.clear()
+                await self._space.wait()
+        else:
+            while self._full(n) and self._drop_oldest_audio():
+                pass
+        self._items.append(_Audio(buf, tag))
+        self._audio_bytes += n
+        self._enqueued()
+
+    def put_control(self, text: str, urgent: bool = False) -> None:
+        """Encola un mensaje de control ya serializado (no se descarta nunca). `urgent` lo pone el primero."""
+        if self.closed:
+            return
+        if urgent:
+            self._items.appendleft(text)
+        else:
+            self._items.append(text)
+        self._enqueued()
+
+    def clear_audio(self) -> int:
+        """Descarta todo el audio pendiente (barge-in; no cuenta como pérdida). Devuelve los bytes eliminados."""
+        removed = self._audio_bytes
+        for item in self._items:
+            if isinstance(item, _Audio):
+                self._recycle(item.buf)
+        self._items = deque(i for i in self._items if not isinstance(i, _Audio))
+        self._audio_bytes = 0
+        self._space.set()
+        return removed
+
+    # ---------- consumidor ----------
+    async def run(self) -> None:
+        """Tarea de envío: saca de la cola y escribe en el WS hasta cancelarse o fallar el envío."""
+        try:
+            while True:
+                while not self._items:
+                    self._not_empty.clear()
+                    await self._not_empty.wait()
+                item = self._items.popleft()
+                mark = None
+                if isinstance(item, _Audio):
+                    n = len(item.buf)
+                    self._audio_bytes -= n
+                    text = self._encode_audio(item.buf)
+                    if item.tag is not None and self._encode_mark:
+                        mark = self._encode_mark(item.tag, n)
+                    self._recycle(item.buf)
+                else:
+                    text = item
+                self._space.set()
+                t0 = time.perf_counter()
+                await self._send(text)
+                if mark is not None:
+                    await self._send(mark)
+                if self._on_send:
+                    self._on_send(time.perf_counter() - t0)
+                self.sent += 1
+        finally:
+            self.closed = True
+            self._space.set()
+
+    async def drain(self, timeout: float = 1.0) -> None:
+        """Espera (como mucho `timeout` s) a que se vacíe la cola."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._items and not self.closed and loop.time() < deadline:
+            await asyncio.sleep(0.01)
@@ -0,0 +1,213 @@
+# voice_recorder.py — grabación de las dos patas de la llamada sin bloquear el event loop
+# El loop sólo copia la trama a una cola en memoria acotada; un hilo escritor la vacía a disco
+# (decodificando a PCM16 para WAV) con un `write` por pata y lote. Si el disco no da abasto
+# y la cola llega a su límite, las tramas nuevas se descartan y se cuentan: la llamada no espera.
+# Las dos patas comparten línea de tiempo: cada trama lleva su instante (muestras desde que se
+# abrió la grabación) y el escritor rellena con silencio los huecos. El audio del agente se graba
+# al enviarlo a Twilio y suena a continuación del anterior, como lo reproduce Twilio; lo que un
+# barge-in borra (`clear`) antes de sonar se quita de la grabación.
+import os
+import queue
+import threading
+import time
+import wave
+from typing import Dict, List, Optional, Tuple
+
+from voice_codec import ulaw_decode
+
+FORMATS = ("wav", "ulaw")
+LEGS = ("caller", "agent")  # llamante (Twilio -> gateway) | agente (modelo -> Twilio)
+RATE = 8000                 # µ-law 8k: 1 byte = 1 muestra
+SILENCE = b"\xff"           # µ-law de amplitud 0
+
+class _Leg:
+    """Estado del escritor por pata: `tail` es el audio ya programado a partir de `written`."""
+    __slots__ = ("handle", "written", "tail")
+
+    def __init__(self):
+        self.handle = None
+        self.written = 0          # muestras ya escritas a disco (audio + silencio)
+        self.tail = bytearray()   # audio que aún no ha llegado a su instante
+
+class CallRecording:
+    """Grabación de una llamada: `<base>.caller.<ext>` y `<base>.agent.<ext>`, µ-law 8k de entrada."""
+
+    def __init__(self, recorder: "CallRecorder", base_path: str):
+        self._recorder = recorder
+        self.base_path = base_path
+        self.frames = 0
+        self.bytes = 0
+        self.dropped_frames = 0
+        self.closed = False
+        self._t0 = time.monotonic()
+
+    def now(self) -> int:
+        """Instante actual en muestras desde la apertura (línea de tiempo común de las dos patas)."""
+        return int((time.monotonic() - self._t0) * RATE)
+
+    def caller(self, ulaw) -> None:
+        """Trama recibida de Twilio."""
+        self._recorder.submit(self, "caller", ulaw)
+
+    def agent(self, ulaw) -> None:
+        """Audio enviado a Twilio (llamar al enviarlo, no al encolarlo)."""
+        self._recorder.submit(self, "agent", ulaw)
+
+    def clear(self) -> None:
+        """Twilio ha descartado el audio del agente aún no reproducido (barge-in)."""
+        if not self.closed:
+            self._recorder.control(self, "clear", "agent")
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._recorder.control(self, "close", None)
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "bytes": self.bytes, "dropped_frames": self.dropped_frames}
+
+class CallRecorder:
+    """
+    Un hilo escritor por proceso (se arranca con la primera grabación).
+    `max_bytes` acota el audio pendiente de escribir entre todas las llamadas del worker.
+    """
+
+    def __init__(self, directory: str, fmt: str = "wav", max_bytes: int = 8 * 1024 * 1024, batch: int = 256):
+        if fmt not in FORMATS:
+            raise ValueError(f"formato de grabación no válido: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.max_bytes = int(max_bytes)
+        self.batch = max(1, int(batch))
+        self._q: "queue.SimpleQueue[Tuple]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._thread: Optional[threading.Thread] = None
+        # Contadores del worker
+        self.written_bytes = 0
+        self.dropped_frames = 0
+        self.errors = 0
+
+    # ---------- event loop ----------
+    def open(self, name: str) -> CallRecording:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="voice-recorder", daemon=True)
+            self._thread.start()
+        return CallRecording(self, os.path.join(self.directory, name))
+
+    def submit(self, rec: CallRecording, leg: str, data) -> None:
+        """Copia la trama (puede ser una vista de un buffer reutilizado) y la encola; nunca espera."""
+        if rec.closed:
+            return
+        data = bytes(data)
+        n = len(data)
+        with self._lock:
+            if self._pending + n > self.max_bytes:
+                rec.dropped_frames += 1
+                self.dropped_frames += 1
+                return
+            self._pending += n
+        rec.frames += 1
+        rec.bytes += n
+        # La trama del llamante llega al acabar de sonar: empieza `n` muestras antes
+        t = rec.now() - (n if leg == "caller" else 0)
+        self._q.put(("frame", rec, leg, data, max(0, t)))
+
+    def control(self, rec: CallRecording, kind: str, leg: Optional[str]) -> None:
+        self._q.put((kind, rec, leg, None, rec.now()))
+
+    def stats(self) -> dict:
+        return {"pending_bytes": self._pending, "written_bytes": self.written_bytes,
+                "dropped_frames": self.dropped_frames, "errors": self.errors}
+
+    # ---------- hilo escritor ----------
+    def _open_leg(self, rec: CallRecording, leg: str):
+        os.makedirs(os.path.dirname(rec.base_path) or ".", exist_ok=True)
+        path = f"{rec.base_path}.{leg}.{self.fmt}"
+        if self.fmt == "ulaw":
+            return open(path, "wb")
+        w = wave.open(path, "wb")
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        return w
+
+    def _write(self, handle, data) -> None:
+        if self.fmt == "ulaw":
+            handle.write(data)
+        else:
+            handle.writeframesraw(ulaw_decode(data).tobytes())  # cabecera WAV al cerrar
+
+    def _flush(self, rec: CallRecording, leg: str, st: _Leg, upto: int) -> None:
+        """Escribe la pata hasta la muestra `upto`: el audio programado y, si no llega, silencio."""
+        n = upto - st.written
+        if n <= 0:
+            return
+        data = bytes(st.tail[:n])
+        del st.tail[:n]
+        if len(data) < n:
+            data += SILENCE * (n - len(data))
+        try:
+            if st.handle is None:
+                st.handle = self._open_leg(rec, leg)
+            self._write(st.handle, data)
+            self.written_bytes += len(data)
+        except Exception as e:
+            self.errors += 1
+            print("[VOICE] error grabando", rec.base_path, e)
+        st.written = upto
+
+    def _run(self) -> None:
+        legs: Dict[Tuple[int, str], _Leg] = {}  # (id(grabación), pata) -> estado
+        while True:
+            items = [self._q.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Programar las tramas en su instante; el lote se escribe hasta el último instante
+            # visto por grabación (lo posterior puede borrarlo aún un `clear`)
+            horizon: Dict[int, Tuple[CallRecording, int]] = {}
+            closing: List[CallRecording] = []
+            size = 0
+            for kind, rec, leg, data, t in items:
+                if kind == "frame":
+                    st = legs.get((id(rec), leg))
+                    if st is None:
+                        st = legs[id(rec), leg] = _Leg()
+                    end = st.written + len(st.tail)
+                    if t > end:
+                        st.tail += SILENCE * (t - end)
+                    st.tail += data
+                    size += len(data)
+                elif kind == "clear":
+                    st = legs.get((id(rec), leg))
+                    if st is not None:
+                        del st.tail[max(0, t - st.written):]
+                else:
+                    closing.append(rec)
+                    for lg in LEGS:
+                        st = legs.get((id(rec), lg))
+                        if st is not None:
+                            del st.tail[max(0, t - st.written):]  # lo que no sonó antes de colgar
+                horizon[id(rec)] = (rec, t)
+
+            for rec, t in horizon.values():
+                for leg in LEGS:
+                    st = legs.get((id(rec), leg))
+                    if st is not None:
+                        self._flush(rec, leg, st, t)
+            with self._lock:
+                self._pending -= size
+
+            for rec in closing:
+                for leg in LEGS:
+                    st = legs.pop((id(rec), leg), None)
+                    if st is not None and st.handle is not None:
+                        try:
+                            st.handle.close()
+                        except Exception as e:
+                            self.errors += 1
+                            print("[VOICE] error cerrando grabación", rec.base_path, e)
@@ -0,0 +1,139 @@
+# voice_replay.py — grabar y reproducir sesiones del gateway sin red (regresiones del codec)
+# - record: arranca el gateway (main:app) con VOICE_CAPTURE_DIR; cada llamada deja <streamSid>.vcap
+#           con las tramas de Twilio y los response.audio.delta del modelo tal como llegaron.
+# - replay: pasa una captura por CallAudio de main.py (las mismas funciones de decode/resample/encode)
+#           a toda velocidad o a N× tiempo real, y muestra tramas/s, tiempo por etapa y checksums.
+#           Una captura passthrough (la normal) no pasa por ningún codec: con --transcode se fuerza
+#           la transcodificación (los deltas µ-law se convierten antes a PCM16 16k, fuera de la medida).
+#           Si la repetición no mide ninguna etapa de codec se avisa (con --require-codec, error).
+#
+# Uso:
+#   python voice_replay.py record --dir captures --port 8000 [--transcode]
+#   python voice_replay.py replay captures/MZxxxx.vcap [--speed 1] [--repeat 5] [--transcode] [--json]
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from voice_capture import KIND_MODEL_DELTA, KIND_TWILIO_MEDIA, read_capture
+
+FRAME_BYTES_PER_MS = 8  # µ-law 8 kHz (Twilio)
+CODEC_STAGES = ("decode", "resample", "encode")  # etapas de CallAudio fuera del modo passthrough
+
+# ========= record =========
+def cmd_record(args) -> int:
+    env = dict(os.environ)
+    env["VOICE_CAPTURE_DIR"] = os.path.abspath(args.dir)
+    env["VOICE_ULAW_PASSTHROUGH"] = "off" if args.transcode else env.get("VOICE_ULAW_PASSTHROUGH", "on")
+    print(f"gateway en {args.host}:{args.port}, capturas en {env['VOICE_CAPTURE_DIR']} (Ctrl+C para parar)")
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port)]
+    try:
+        return subprocess.call(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    except KeyboardInterrupt:
+        return 0
+
+# ========= replay =========
+def ulaw_deltas_to_pcm16(records: list) -> list:
+    """Deltas µ-law 8k de una captura passthrough -> PCM16 16k, lo que manda el modelo sin passthrough."""
+    from voice_buffers import FrameBuffers
+    from voice_resample import Resampler
+
+    frames, up = FrameBuffers(), Resampler(8000, 16000)
+    return [(kind, t_ms, up.process(frames.decode(payload)).tobytes() if kind == KIND_MODEL_DELTA else payload)
+            for kind, t_ms, payload in records]
+
+def replay_once(meta: dict, records: list, speed: float, passthrough: bool) -> dict:
+    # Import aquí: `record` no necesita cargar FastAPI/numpy en este proceso
+    from main import CallAudio
+    from voice_metrics import CallMetrics, GatewayMetrics
+
+    metrics = CallMetrics(GatewayMetrics())
+    audio = CallAudio(metrics, passthrough=passthrough)
+    h_in, h_out = hashlib.sha256(), hashlib.sha256()
+    frames_in = frames_out = 0
+    t0 = time.perf_counter()
+    for kind, t_ms, payload in records:
+        if speed > 0:
+            delay = t0 + t_ms / 1000.0 / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if kind == KIND_TWILIO_MEDIA:
+            h_in.update(audio.to_model(payload))
+            frames_in += 1
+        elif kind == KIND_MODEL_DELTA:
+            h_out.update(audio.to_twilio(payload))
+            frames_out += 1
+    wall = time.perf_counter() - t0
+    summary = metrics.close()
+    return {
+        "frames_in": frames_in, "frames_out": frames_out, "wall_s": round(wall, 4),
+        "frames_per_s": round((frames_in + frames_out) / wall) if wall > 0 else None,
+        "stages": summary["stages"],
+        "sha256_to_model": h_in.hexdigest(), "sha256_to_twilio": h_out.hexdigest(),
+    }
+
+def cmd_replay(args) -> int:
+    meta, it = read_capture(args.file)
+    records = list(it)  # a memoria: la lectura del fichero no cuenta en el tiempo
+    audio_ms = sum(len(p) for k, _, p in records if k == KIND_TWILIO_MEDIA) / FRAME_BYTES_PER_MS
+    passthrough = bool(meta.get("passthrough", True))
+    if args.transcode and passthrough:
+        records = ulaw_deltas_to_pcm16(records)
+        passthrough = False
+    runs = [replay_once(meta, records, args.speed, passthrough) for _ in range(max(1, args.repeat))]
+    best = min(runs, key=lambda r: r["wall_s"])
+    if len({(r["sha256_to_model"], r["sha256_to_twilio"]) for r in runs}) != 1:
+        print("AVISO: checksums distintos entre repeticiones (estado no determinista)", file=sys.stderr)
+    if not any(best["stages"].get(s, {}).get("n") for s in CODEC_STAGES):
+        print("AVISO: la repetición no ha medido ninguna etapa de codec (captura passthrough); "
+              "usa --transcode para pasar el audio por la transcodificación", file=sys.stderr)
+        if args.require_codec:
+            return 1
+    result = {
+        "file": args.file, "stream_sid": meta.get("stream_sid"), "passthrough": passthrough,
+        "vcap_passthrough": meta.get("passthrough"),
+        "records": len(records), "audio_in_s": round(audio_ms / 1000.0, 2),
+        "speed": args.speed or "max", "repeat": len(runs),
+        "realtime_factor": round(audio_ms / 1000.0 / best["wall_s"], 1) if best["wall_s"] > 0 else None,
+        **best,
+    }
+    if args.json:
+        print(json.dumps(result))
+        return 0
+    for key in ("file", "stream_sid", "passthrough", "vcap_passthrough", "records", "audio_in_s", "speed", "repeat",
+                "frames_in", "frames_out", "wall_s", "frames_per_s", "realtime_factor"):
+        print(f"{key:<17}{result[key]}")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:<15}n={s['n']:<7}avg={s['avg_ms']:.3f} ms  max={s['max_ms']:.3f} ms")
+    print(f"{'sha256_to_model':<17}{result['sha256_to_model']}")
+    print(f"{'sha256_to_twilio':<17}{result['sha256_to_twilio']}")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Grabar y reproducir sesiones de audio del gateway de voz")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rec = sub.add_parser("record", help="arranca el gateway capturando cada llamada en --dir")
+    rec.add_argument("--dir", default="captures")
+    rec.add_argument("--host", default="0.0.0.0")
+    rec.add_argument("--port", type=int, default=8000)
+    rec.add_argument("--transcode", action="store_true", help="VOICE_ULAW_PASSTHROUGH=off (deltas PCM16 16k)")
+
+    rep = sub.add_parser("replay", help="reproduce una captura por el pipeline de audio de main.py")
+    rep.add_argument("file")
+    rep.add_argument("--speed", type=float, default=0.0, help="N× tiempo real; 0 = lo más rápido posible")
+    rep.add_argument("--repeat", type=int, default=1, help="repeticiones (se informa la más rápida)")
+    rep.add_argument("--transcode", action="store_true",
+                     help="fuerza la transcodificación aunque la captura sea passthrough")
+    rep.add_argument("--require-codec", action="store_true",
+                     help="sale con error si no se mide ninguna etapa de codec")
+    rep.add_argument("--json", action="store_true")
+
+    args = ap.parse_args()
+    sys.exit(cmd_record(args) if args.cmd == "record" else cmd_replay(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# voice_sessions.py — estado de la llamada entre webhooks de Twilio, por CallSid
+# Idioma detectado, historial de intenciones y reintentos. Así los saltos siguientes no
+# vuelven a detectar desde cero y se puede limitar los reintentos antes de pasar a un agente.
+#   VOICE_SESSION_BACKEND=memory  -> LRU con TTL en el proceso (un worker)
+#   VOICE_SESSION_BACKEND=sqlite  -> fichero SQLite (WAL) compartido entre workers de gunicorn
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "data", "voice_sessions.db")
+
+def new_session() -> dict:
+    return {"lang": None, "intents": [], "retries": 0}
+
+class MemorySessionStore:
+    """LRU acotado a `max_entries`; una sesión sin tocar en `ttl_s` segundos caduca."""
+
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 3600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # call_sid -> (instante, sesión)
+        self._lock = threading.Lock()
+
+    def get(self, call_sid: str) -> dict:
+        """Copia de la sesión (nueva si no existe o ha caducado)."""
+        if not call_sid:
+            return new_session()
+        with self._lock:
+            item = self._data.get(call_sid)
+            if item is None or time.monotonic() - item[0] > self.ttl_s:
+                self._data.pop(call_sid, None)
+                return new_session()
+            self._data.move_to_end(call_sid)
+            return json.loads(item[1])
+
+    def save(self, call_sid: str, session: dict) -> None:
+        if not call_sid:
+            return
+        with self._lock:
+            self._data[call_sid] = (time.monotonic(), json.dumps(session))
+            self._data.move_to_end(call_sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, call_sid: str) -> None:
+        with self._lock:
+            self._data.pop(call_sid, None)
+
+class SQLiteSessionStore:
+    """Una fila por llamada con la sesión en JSON; las caducadas se borran cada `purge_every` escrituras."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, ttl_s: float = 3600.0, purge_every: int = 200):
+        self.path = path
+        self.ttl_s = float(ttl_s)
+        self.purge_every = max(1, int(purge_every))
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS voice_sessions (
+                  call_sid TEXT PRIMARY KEY,
+                  data TEXT NOT NULL,
+                  updated_at REAL NOT NULL   -- epoch (s)
+                )
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Una conexión por hilo; WAL para que los workers lean mientras otro escribe."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, call_sid: str) -> dict:
+        if not call_sid:
+            return new_session()
+        row = self._conn().execute(
+            "SELECT data FROM voice_sessions WHERE call_sid = ? AND updated_at >= ?",
+            (call_sid, time.time() - self.ttl_s),
+        ).fetchone()
+        return json.loads(row[0]) if row else new_session()
+
+    def save(self, call_sid: str, session: dict) -> None:
+        if not call_sid:
+            return
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO voice_sessions (call_sid, data, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(call_sid) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                """,
+                (call_sid, json.dumps(session), now),
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                conn.execute("DELETE FROM voice_sessions WHERE updated_at < ?", (now - self.ttl_s,))
+
+    def delete(self, call_sid: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM voice_sessions WHERE call_sid = ?", (call_sid,))
+
+def make_session_store(backend: Optional[str] = None):
+    """Store según VOICE_SESSION_BACKEND (memory | sqlite)."""
+    backend = (backend or os.getenv("VOICE_SESSION_BACKEND", "memory")).lower()
+    ttl_s = float(os.getenv("VOICE_SESSION_TTL_S", "3600"))
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("VOICE_SESSION_DB", DEFAULT_DB_PATH), ttl_s)
+    if backend != "memory":
+        raise ValueError(f"VOICE_SESSION_BACKEND no válido: {backend}")
+    return MemorySessionStore(int(os.getenv("VOICE_SESSION_MAX", "10000")), ttl_s)
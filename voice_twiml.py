@@ -0,0 +1,32 @@
+# voice_twiml.py — TwiML precompilado para los webhooks de voz
+# Las respuestas se renderizan una vez (al importar el módulo que las sirve) a bytes listos
+# para enviar; por petición sólo queda un lookup en un dict. Los valores se escapan como XML
+# (texto y atributos) y los campos dinámicos se rellenan sobre la plantilla ya troceada.
+import re
+
+CONTENT_TYPE = "text/xml; charset=utf-8"
+
+_FIELD = re.compile(r"\{(\w+)\}")
+_XML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&apos;"})
+
+def xml_escape(value) -> str:
+    """Escapa para texto y para atributos entre comillas dobles o simples."""
+    return str(value).translate(_XML_ESCAPES)
+
+class TwimlTemplate:
+    """
+    Plantilla con campos `{nombre}`, troceada una sola vez.
+    `render(**valores)` escapa cada valor e intercala: sin format() ni parseo por petición.
+    """
+
+    def __init__(self, source: str):
+        parts = _FIELD.split(source.strip())
+        self._static = parts[0::2]
+        self.fields = tuple(parts[1::2])
+
+    def render(self, **values) -> bytes:
+        out = [self._static[0]]
+        for name, text in zip(self.fields, self._static[1:]):
+            out.append(xml_escape(values[name]))
+            out.append(text)
+        return "".join(out).encode("utf-8")
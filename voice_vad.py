@@ -0,0 +1,97 @@
+# voice_vad.py — VAD por energía en el gateway, antes de input_audio_buffer.append
+# Trabaja sobre las tramas µ-law de Twilio sin decodificarlas: la energía sale de una tabla
+# de 256 cuadrados (un `take` + suma por trama). Tras el habla mantiene `hangover_ms` de audio
+# para que el server_vad del modelo siga viendo el silencio que cierra el turno.
+from collections import deque
+from typing import Deque, Sequence
+
+import numpy as np
+
+from voice_codec import ULAW_DECODE_TABLE
+
+ULAW_SQUARE_TABLE = ULAW_DECODE_TABLE.astype(np.float64) ** 2
+MODES = ("off", "drop", "thin")
+
+class EnergyVAD:
+    """
+    Una instancia por llamada.
+    - Trama con energía media >= `threshold_dbfs` -> habla: se envía y rearma el hangover.
+    - Silencio dentro del hangover -> se envía.
+    - Silencio fuera del hangover -> `drop` la descarta; `thin` envía una de cada `thin_every`.
+    Al volver el habla se envían antes las últimas `preroll_ms` de silencio descartado
+    (el arranque de la palabra suele quedar por debajo del umbral).
+    """
+
+    def __init__(self, mode: str = "drop", threshold_dbfs: float = -45.0, hangover_ms: int = 600,
+                 preroll_ms: int = 60, thin_every: int = 5, frame_ms: int = 20):
+        if mode not in MODES:
+            raise ValueError(f"modo de VAD no válido: {mode}")
+        self.mode = mode
+        self.threshold_dbfs = float(threshold_dbfs)
+        self._threshold = (32768.0 * 10 ** (self.threshold_dbfs / 20.0)) ** 2  # potencia media
+        self.hangover_frames = max(0, int(hangover_ms) // frame_ms)
+        self.thin_every = max(1, int(thin_every))
+        self._preroll: Deque[bytes] = deque(maxlen=max(0, int(preroll_ms) // frame_ms))
+        self._hang = 0         # tramas de hangover restantes
+        self._silent_run = 0   # tramas de silencio seguidas fuera del hangover
+        self._sq = np.empty(1024, dtype=np.float64)
+        # Contadores por llamada
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.speech_frames = 0
+
+    def energy_dbfs(self, ulaw) -> float:
+        """Energía media de una trama µ-law en dBFS (-inf si es silencio digital)."""
+        p = self._power(ulaw)
+        return 10.0 * np.log10(p) - 20.0 * np.log10(32768.0) if p > 0 else float("-inf")
+
+    def _power(self, ulaw) -> float:
+        codes = np.frombuffer(ulaw, dtype=np.uint8)
+        n = codes.size
+        if not n:
+            return 0.0
+        if n > self._sq.size:
+            self._sq = np.empty(2 * n, dtype=np.float64)
+        sq = self._sq[:n]
+        ULAW_SQUARE_TABLE.take(codes, out=sq, mode="clip")
+        return float(sq.sum()) / n
+
+    def feed(self, ulaw: bytes) -> Sequence[bytes]:
+        """Devuelve las tramas a reenviar por esta (0, 1 o pre-roll + la actual). `ulaw` no debe reutilizarse."""
+        self.frames_in += 1
+        if self.mode == "off":
+            self.frames_sent += 1
+            return (ulaw,)
+
+        if self._power(ulaw) >= self._threshold:
+            self.speech_frames += 1
+            self._hang = self.hangover_frames
+            self._silent_run = 0
+            out = (*self._preroll, ulaw) if self._preroll else (ulaw,)
+            self._preroll.clear()
+            self.frames_sent += len(out)
+            self.frames_suppressed -= len(out) - 1  # el pre-roll ya contaba como suprimido
+            return out
+
+        if self._hang > 0:
+            self._hang -= 1
+            self.frames_sent += 1
+            return (ulaw,)
+
+        self._silent_run += 1
+        if self.mode == "thin" and self._silent_run % self.thin_every == 0:
+            self._preroll.clear()
+            self.frames_sent += 1
+            return (ulaw,)
+        if self._preroll.maxlen:
+            self._preroll.append(ulaw)
+        self.frames_suppressed += 1
+        return ()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode, "frames_in": self.frames_in, "frames_sent": self.frames_sent,
+            "frames_suppressed": self.frames_suppressed, "speech_frames": self.speech_frames,
+            "suppressed_ratio": round(self.frames_suppressed / self.frames_in, 3) if self.frames_in else 0.0,
+        }